@@ -0,0 +1,81 @@
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from modules.image_generator import ImageWriter
+
+IMAGES = 10
+SIZE = (1000, 1500)
+
+# Output settings compared by the benchmark, the first one is the default
+CASES = {
+    'png, compress_level 6 (default)': {'image_format': 'png'},
+    'png, compress_level 1': {'image_format': 'png', 'compress_level': 1},
+    'png, compress_level 9': {'image_format': 'png', 'compress_level': 9},
+    'jpeg, quality 90': {'image_format': 'jpeg', 'quality': 90},
+    'jpeg, quality 85, optimize': {'image_format': 'jpeg', 'quality': 85, 'optimize': True},
+    'webp, quality 85': {'image_format': 'webp', 'quality': 85},
+}
+
+
+def render(seed):
+    # An opaque canvas with a blurred photo-like background, shapes and text blocks like a pin image
+    rng = random.Random(seed)
+    canvas = Image.new('RGBA', SIZE, (rng.randrange(256), rng.randrange(256), rng.randrange(256), 255))
+    draw = ImageDraw.Draw(canvas)
+    for _ in range(60):
+        x, y = rng.randrange(SIZE[0]), rng.randrange(SIZE[1])
+        draw.ellipse((x, y, x + rng.randrange(50, 400), y + rng.randrange(50, 400)),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255))
+    canvas = canvas.filter(ImageFilter.GaussianBlur(8))
+
+    draw = ImageDraw.Draw(canvas)
+    for number in range(4):
+        top = 400 + number * 220
+        draw.rounded_rectangle((150, top, 870, top + 150), radius=20, fill='white')
+        for line in range(3):
+            draw.text((200, top + 20 + line * 40), 'Eat more healthy fats every single day ' * 2, fill='#323232')
+    draw.rectangle((0, SIZE[1] - 100, SIZE[0], SIZE[1]), fill='#475b75')
+    return canvas
+
+
+def run(folder, queue_size, images, **params):
+    writer = ImageWriter(queue_size=queue_size, **params)
+    extension = params['image_format']
+
+    # Silence the message the writer logs for every image
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for number, image in enumerate(images, start=1):
+            # Stand-in for the render work of the next image, which overlaps with encoding on the writer thread
+            image.filter(ImageFilter.BoxBlur(2))
+            writer.write(image, os.path.join(folder, f'{number}.{extension}'), number)
+        writer.close()
+        total_seconds = time.perf_counter() - start
+
+    return writer.stats(), total_seconds
+
+
+def main():
+    images = [render(seed) for seed in range(IMAGES)]
+
+    with tempfile.TemporaryDirectory() as folder:
+        print(f'{IMAGES} images of {SIZE[0]}x{SIZE[1]}:')
+        for name, params in CASES.items():
+            stats, _ = run(folder, 0, images, **params)
+            print(f'{name:>38}: {stats["bytes"] / IMAGES / 1024:8.0f} KB/image, '
+                  f'encode {stats["encode_seconds"] / IMAGES * 1000:6.0f} ms/image')
+
+        print(f'\nRender and save loop, png compress_level 6 ({os.cpu_count()} CPUs):')
+        for queue_size, name in ((0, 'synchronous save'), (4, 'writer thread, queue of 4')):
+            _, total_seconds = run(folder, queue_size, images, image_format='png')
+            print(f'{name:>38}: {total_seconds / IMAGES * 1000:6.0f} ms/image')
+
+
+if __name__ == '__main__':
+    main()
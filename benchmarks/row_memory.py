@@ -0,0 +1,64 @@
+import sys
+import tracemalloc
+
+from modules.records import UploadingData, UploadingDataRecord
+
+ROWS = 100_000
+
+
+class LegacyUploadingData:
+    # The pin data class as it was before the slotted records, with eager preparation
+    def __init__(self, file_path='', board_name='', hashtag='', pin_title='', pin_description='',
+                 pin_link='', mode='', keyword=''):
+        self.file_path = file_path
+        self.board_name = board_name
+        self._hashtag = UploadingData._prepare_hashtags(hashtag)
+        self.pin_title = UploadingData._truncate_text(pin_title, 95)
+        self.pin_description = UploadingData._prepare_description(pin_description, self._hashtag, 495, 400)
+        self.pin_link = pin_link
+        self.mode = mode
+        self.keyword = keyword
+
+
+def make_values(number):
+    return ['image', f'keto recipe {number}', f'Title number {number}', f'Description number {number}',
+            f'/images/{number}.png', 'Keto Recipes', '']
+
+
+def measure(factory):
+    # Create the row values up front so only the row objects are traced
+    values = [make_values(number) for number in range(ROWS)]
+
+    tracemalloc.start()
+    rows = [factory(row_values) for row_values in values]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Do not count the list that holds the rows
+    size -= sys.getsizeof(rows)
+
+    del rows, values
+    return size / ROWS
+
+
+def main():
+    columns = UploadingDataRecord.__slots__
+
+    results = {
+        'CSV row as dict': measure(lambda values: dict(zip(columns, values))),
+        'CSV row as UploadingDataRecord': measure(lambda values: UploadingDataRecord(*values)),
+        'Legacy UploadingData': measure(lambda values: LegacyUploadingData(
+            file_path=values[4], board_name=values[5], hashtag=values[1], pin_title=values[2],
+            pin_description=values[3], pin_link=values[6], mode=values[0], keyword=values[1])),
+        'Slotted UploadingData': measure(lambda values: UploadingData(
+            file_path=values[4], board_name=values[5], hashtag=values[1], pin_title=values[2],
+            pin_description=values[3], pin_link=values[6], mode=values[0], keyword=values[1])),
+    }
+
+    print(f'Bytes per row ({ROWS} rows):')
+    for name, size in results.items():
+        print(f'{name:>32}: {size:8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import random
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from modules.text_layout import TextLayoutEngine
+
+ROUNDS = 20
+WORDS = ['keto', 'recipes', 'for', 'busy', 'weeknights', 'with', 'simple', 'ingredients', 'and', 'flavour',
+         'healthy', 'breakfast', 'ideas', 'that', 'everyone', 'will', 'love', 'easy', 'low', 'carb', 'dinner']
+
+
+def legacy_wrap(text, font, max_width):
+    # The word wrapping as it was before the layout engine, measuring the whole line for every word
+    lines = []
+    words = text.split()
+    current_line = words[0]
+
+    for word in words[1:]:
+        test_line = current_line + " " + word
+        bbox = font.getbbox(test_line)
+
+        if bbox[2] - bbox[0] <= max_width:
+            current_line = test_line
+        else:
+            lines.append(current_line)
+            current_line = word
+
+    lines.append(current_line)
+    return '\n'.join(lines)
+
+
+def legacy_layout(text, font, max_width, draw):
+    wrapped_text = legacy_wrap(text, font, max_width)
+    return draw.multiline_textbbox((0, 0), wrapped_text, font=font, spacing=4)
+
+
+def make_texts(count, length):
+    rng = random.Random(length)
+    return [' '.join(rng.choice(WORDS) for _ in range(length)) for _ in range(count)]
+
+
+def measure(function, texts):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for text in texts:
+            function(text)
+    return (time.perf_counter() - start) / (ROUNDS * len(texts)) * 1000
+
+
+def main():
+    # An optional TrueType font path can be given, otherwise the default Pillow font is used
+    font = ImageFont.truetype(sys.argv[1], 60) if len(sys.argv) > 1 else ImageFont.load_default(60)
+    draw = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+    engine = TextLayoutEngine(font)
+
+    cases = {
+        'title (12 words, 900px)': (make_texts(50, 12), 900),
+        'tip (40 words, 700px)': (make_texts(50, 40), 700),
+        'long text (200 words, 700px)': (make_texts(10, 200), 700),
+    }
+
+    print(f'Milliseconds per text ({ROUNDS} rounds):')
+    for name, (texts, max_width) in cases.items():
+        legacy = measure(lambda text: legacy_layout(text, font, max_width, draw), texts)
+        cached = measure(lambda text: engine.layout(text, max_width).get_bbox(), texts)
+        print(f'{name:>30}: legacy {legacy:8.3f}  engine {cached:8.3f}  speedup {legacy / cached:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
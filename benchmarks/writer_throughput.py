@@ -0,0 +1,61 @@
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from modules.llm_backends import StubBackend
+from modules.writer import Writer
+
+ROWS = 200
+LATENCY = 0.05  # Seconds of a stub answer, plus up to JITTER
+JITTER = 0.05
+FAILURE_RATE = 0.02
+CONCURRENCY = (1, 2, 4, 8, 16, 32, 64)
+
+
+def make_rows(count):
+    return [{'keyword': f'keyword {number}',
+             'title_prompt': f'Write a title about keyword {number}',
+             'description_prompt': 'Write a description for SELECTED TITLE',
+             'tips_prompt': 'Write 4 tips for SELECTED TITLE'} for number in range(count)]
+
+
+def run(rows, max_workers):
+    backend = StubBackend(latency=LATENCY, jitter=JITTER, failure_rate=FAILURE_RATE, seed=max_workers)
+
+    # The cache is disabled, every prompt goes to the stub backend
+    writer = Writer('benchmark', backend=backend, cache=False)
+
+    # Silence the messages the writer logs for every row and every failed prompt
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        if max_workers == 1:
+            for row in rows:
+                writer.write(row, Writer.WRITER_MODE_2)
+        else:
+            writer.write_many(rows, Writer.WRITER_MODE_2, max_workers=max_workers)
+        writer.close()
+        total_seconds = time.perf_counter() - start
+
+    return total_seconds, backend
+
+
+def main():
+    rows = make_rows(ROWS)
+
+    with tempfile.TemporaryDirectory() as folder:
+        # The writer creates its project and data folders in the working directory
+        os.chdir(folder)
+
+        print(f'{ROWS} image rows (3 prompts each), stub latency {LATENCY * 1000:.0f}-'
+              f'{(LATENCY + JITTER) * 1000:.0f} ms, failure rate {FAILURE_RATE:.0%}:')
+        for max_workers in CONCURRENCY:
+            total_seconds, backend = run(rows, max_workers)
+            name = 'sequential write' if max_workers == 1 else f'write_many, {max_workers} workers'
+            print(f'{name:>28}: {ROWS / total_seconds:8.1f} rows/s, {backend.calls} calls, '
+                  f'{backend.failures} failures')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
+import os
+
 
 def creating_boards(timeout):
     from modules.account_manager import AccountManager
@@ -15,46 +17,77 @@ def creating_boards(timeout):
         pinner.login()
         created_boards = pinner.create_boards(boards_data, timeout)
 
-        for row in created_boards:
-            base.write_csv(row, base.CREATED_BOARDS_FILE)
+        with base.open_appender(base.CREATED_BOARDS_FILE) as appender:
+            appender.writerows(created_boards)
 
 
-def uploading(mode, pins, shuffle, headless, timeout, move_data_after_upload):
+def uploading(mode, pins, shuffle, headless, timeout, move_data_after_upload, storage='csv'):
     from modules.account_manager import AccountManager
     from modules.base import Pinterest
+    from modules.ledger import UploadLedger
     from modules.pinner import RequestsPinner
     from modules.pinner import SeleniumPinner
+    from modules.store import ProjectStore
 
     account_manager = AccountManager()
     accounts = account_manager.get_accounts()
 
     for account in accounts:
         base = Pinterest(account['project_folder'])
-        uploading_data = base.open_csv(base.UPLOADING_DATA_FILE)
-
-        if mode == base.UPLOADER_MODE_1:
-            pinner = RequestsPinner(**account)
-
-            pinner.login(headless=headless)
-            pinner.upload(uploading_data, pins=pins, shuffle=shuffle, timeout=timeout,
-                          move_data_after_upload=move_data_after_upload)
-        elif mode == base.UPLOADER_MODE_2:
-            pinner = SeleniumPinner(**account, headless=headless)
-
-            pinner.login()
-            pinner.upload(uploading_data, pins=pins, shuffle=shuffle, timeout=timeout,
-                          move_data_after_upload=move_data_after_upload)
-        else:
-            raise ValueError(f"Invalid mode: {mode}. Check the available modes in the base class.")
 
-
-def image_generation(project_folder, mode):
+        store = None
+        try:
+            if storage == base.STORAGE_MODE_1:
+                # Skip the Pins that are already recorded in the upload ledger
+                uploaded = UploadLedger(account['project_folder']).uploaded
+                # Read only the rows that will be pinned instead of the whole table
+                uploading_data = base.sample_csv(base.UPLOADING_DATA_FILE, pins, shuffle=shuffle, exclude=uploaded)
+            elif storage == base.STORAGE_MODE_2:
+                store = ProjectStore(account['project_folder'])
+                # Import the rows added to the CSV files since the last run
+                store.import_project()
+                uploading_data = store.sample_csv(base.UPLOADING_DATA_FILE, pins, shuffle=shuffle)
+            else:
+                raise ValueError(f"Invalid storage: {storage}. Check the available storages in the base class.")
+
+            if mode == base.UPLOADER_MODE_1:
+                pinner = RequestsPinner(**account)
+                pinner.store = store
+
+                pinner.login(headless=headless)
+                pinner.upload(uploading_data, pins=pins, shuffle=shuffle, timeout=timeout,
+                              move_data_after_upload=move_data_after_upload)
+            elif mode == base.UPLOADER_MODE_2:
+                pinner = SeleniumPinner(**account, headless=headless)
+                pinner.store = store
+
+                pinner.login()
+                pinner.upload(uploading_data, pins=pins, shuffle=shuffle, timeout=timeout,
+                              move_data_after_upload=move_data_after_upload)
+            else:
+                raise ValueError(f"Invalid mode: {mode}. Check the available modes in the base class.")
+        finally:
+            # Release the claims of the sampled rows that were not uploaded, also when the login or upload fails
+            if store:
+                store.close()
+
+
+def compacting(project_folder):
+    from modules.ledger import UploadLedger
+
+    ledger = UploadLedger(project_folder)
+    moved = ledger.compact()
+    print(f'{moved} uploaded Pins have been moved to the {ledger.UPLOADED_FILE} file.')
+
+
+def image_generation(project_folder, mode, workers=1):
     from modules.base import Pinterest
-    from modules.image_generator import Template1ImageGenerator, Template2ImageGenerator
+    from modules.image_generator import Template1ImageGenerator, Template2ImageGenerator, TemplateImageGenerator
 
     base = Pinterest(project_folder)
 
-    data = base.open_csv(base.GENERATOR_DATA_FILE)
+    # Rows are streamed, a run that was interrupted continues after the last saved row
+    data = base.iter_csv(base.GENERATOR_DATA_FILE)
 
     # Common parameters for all image generators
     common_params = {
@@ -62,7 +95,9 @@ def image_generation(project_folder, mode):
         'height': 1500,  # Image height
         'save': False,  # Save flag
         'show': True,  # Show flag
-        'write_uploading_data': False  # Write uploading data flag
+        'write_uploading_data': False,  # Write uploading data flag
+        'render_cache': False,  # Reuse saved images of rows that have not changed, only when images are saved
+        'variants': None  # Output sizes as (name, width, height), e.g. [('2x3', 1000, 1500), ('1x1', 1000, 1000)]
     }
 
     # Dictionary mapping generation mode to image generator class
@@ -71,30 +106,97 @@ def image_generation(project_folder, mode):
         base.GENERATOR_MODE_2: Template2ImageGenerator  # Mode 2: Template 2 image generator
     }
 
-    # Check if the specified mode is in the generators dictionary
-    if mode in generators:
-        # Get the generator class for the specified mode
-        generator_class = generators[mode]
-        # Create an instance of the generator
-        generator = generator_class(project_folder, **common_params)
-        for number, row in enumerate(data, start=1):
-            # Generate an image for each data row
-            generator.generate_image(row, number)
+    # Check if the specified mode is in the generators dictionary or is a template spec file
+    if mode in generators or os.path.isfile(mode):
+        if mode in generators:
+            # Create an instance of the generator for the specified mode
+            generator = generators[mode](project_folder, **common_params)
+        else:
+            # Create a generic generator that draws the template described in the spec file
+            generator = TemplateImageGenerator(project_folder, mode, **common_params)
+        try:
+            # Generate an image for each data row, in worker processes if more than one worker is given
+            generator.generate_rows(data, workers=workers)
+        finally:
+            # Wait for the images that are still being saved and flush the buffered uploading data rows
+            generator.close()
+            generator.log_cache_stats()
     else:
         # Raise an exception if the mode is invalid
         raise ValueError(f"Invalid mode: {mode}. Check the available modes in the base class.")
 
 
-def writing(project_folder, mode):
+def validating(project_folder, mode):
+    from modules.base import Pinterest
+    from modules.image_generator import Template1ImageGenerator, Template2ImageGenerator, TemplateImageGenerator
+
+    base = Pinterest(project_folder)
+
+    # Rows are streamed, only the layout of each row is computed
+    data = base.iter_csv(base.GENERATOR_DATA_FILE)
+
+    generators = {
+        base.GENERATOR_MODE_1: Template1ImageGenerator,
+        base.GENERATOR_MODE_2: Template2ImageGenerator
+    }
+
+    if mode in generators:
+        generator = generators[mode](project_folder, save=False, show=False)
+    elif os.path.isfile(mode):
+        generator = TemplateImageGenerator(project_folder, mode, save=False, show=False)
+    else:
+        raise ValueError(f"Invalid mode: {mode}. Check the available modes in the base class.")
+
+    generator.validate(data)
+    print(f'The problems have been written to the {base.VALIDATION_REPORT_FILE} file.')
+
+
+def writing(project_folder, mode, workers=8, regenerate=False, retry_failed=False):
     from modules.writer import Writer
 
     table_id = '1IVFmYqJBcS92DPr029c1y9saD_YjgXxTA3GuL7wdTSw'
-    writer = Writer(project_folder)
 
-    data = writer.open_data(mode, google_sheet=True, table_id=table_id)
+    # Backend that answers the prompts, 'stub' answers locally without the network
+    backend_config = {
+        'backend': 'g4f',
+        'model': 'gpt_35_turbo'
+    }
+
+    # Limits of the backend calls, the concurrency is lowered automatically when the calls start failing
+    rate_limit = {
+        'requests_per_minute': 60,
+        'max_concurrency': workers,
+        'max_retries': 4
+    }
+
+    # Hedging is off, e.g. {'percentile': 95, 'max_hedge_ratio': 0.1} sends a prompt again when it takes longer
+    # than 95% of the recent prompts, and the first answer is used
+    hedge = None
+
+    # With regenerate the cached answers are not used, the prompts are sent to the model again
+    writer = Writer(project_folder, backend=backend_config, cache_bypass=regenerate, rate_limit=rate_limit,
+                    hedge=hedge)
+
+    if retry_failed:
+        # Write the rows that failed in the previous runs again
+        data = writer.take_retry_queue(mode)
+    else:
+        data = writer.open_data(mode, google_sheet=True, table_id=table_id)
+
+    try:
+        if workers > 1:
+            # Run the prompts of many rows at the same time, the rows are still written in order
+            writer.write_many(data, mode, max_workers=workers)
+        else:
+            for row in data:
+                writer.write(row, mode)
 
-    for row in data:
-        writer.write(row, mode)
+        if retry_failed:
+            # Every taken row has been written or queued again, remove the taken rows from the queue
+            writer.release_retry_queue(mode)
+    finally:
+        # Flush the buffered rows to the CSV files and print the prompt cache statistics
+        writer.close()
 
 
 if __name__ == '__main__':
@@ -103,13 +205,15 @@ if __name__ == '__main__':
     choice = input("Enter '1' to run the Writer,\n"
                    "'2' to run the Image generator,\n"
                    "'3' to run the Pinner,\n"
-                   "'4' to run the Boards creator: ")
+                   "'4' to run the Boards creator,\n"
+                   "'5' to compact the uploaded data,\n"
+                   "'6' to validate the Image generator data: ")
 
     if choice == '1':
         writer_modes = ['video', 'image', 'own_image']  # The "own_image" mode retrieves data from the video tab in the prompt builder and saves the data in the uploading_data table without a link (for your own link)
         writing(project_name, writer_modes[0])
     elif choice == '2':
-        generator_modes = ['template_1', 'template_2']
+        generator_modes = ['template_1', 'template_2']  # A path to a template spec file (.json or .yaml) also works
         image_generation(project_name, generator_modes[0])
     elif choice == '3':
         pinner_modes = ['requests', 'selenium']
@@ -117,5 +221,10 @@ if __name__ == '__main__':
                   move_data_after_upload=True)
     elif choice == '4':
         creating_boards(timeout=(3, 8))
+    elif choice == '5':
+        compacting(project_name)
+    elif choice == '6':
+        generator_modes = ['template_1', 'template_2']
+        validating(project_name, generator_modes[0])
     else:
-        print("Invalid choice. Please enter '1', '2', '3' or '4'.")
+        print("Invalid choice. Please enter '1', '2', '3', '4', '5' or '6'.")
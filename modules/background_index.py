@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+
+# Linear light value of every 8-bit sRGB channel value
+_SRGB_TO_LINEAR = np.array([value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+                            for value in np.arange(256) / 255.0], dtype=np.float32)
+
+# Weights of the linear red, green and blue channels in the relative luminance
+_LUMINANCE_WEIGHTS = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+def relative_luminance(color):
+    # Relative luminance of an RGB(A) color tuple, from 0 for black to 1 for white
+    return float(_SRGB_TO_LINEAR[list(color[:3])] @ _LUMINANCE_WEIGHTS)
+
+
+def contrast_ratio(luminance_1, luminance_2):
+    # Contrast ratio of two luminances, from 1 for equal luminances to 21 for black on white
+    lighter, darker = max(luminance_1, luminance_2), min(luminance_1, luminance_2)
+    return (lighter + 0.05) / (darker + 0.05)
+
+
+def analyze_region(image, box):
+    # Luminance statistics of a region of the image, computed over the whole pixel array at once
+    pixels = np.asarray(image.crop(box).convert('RGB'))
+    luminance = _SRGB_TO_LINEAR[pixels] @ _LUMINANCE_WEIGHTS
+
+    low, high = np.percentile(luminance, (10, 90))
+    return {
+        'mean': round(float(luminance.mean()), 6),
+        'std': round(float(luminance.std()), 6),
+        'p10': round(float(low), 6),
+        'p90': round(float(high), 6),
+    }
+
+
+class BackgroundLuminanceIndex:
+    # Luminance statistics of the background regions, persisted next to the backgrounds and keyed by the file hash,
+    # so a background is analyzed once even if it is renamed or the generator is restarted
+    INDEX_FILE = '.luminance_index.json'
+
+    def __init__(self, folder_path):
+        self.index_path = os.path.join(folder_path, self.INDEX_FILE)
+        self._entries = None
+
+    def _read(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            # A missing or damaged index is rebuilt from the backgrounds
+            return {}
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    @contextmanager
+    def _lock(self):
+        # Only one process at a time merges its entries into the index file
+        with open(f'{self.index_path}.lock', 'a+b') as lock_file:
+            lock_file.seek(0)
+            if os.name == 'nt':
+                import msvcrt
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # The lock is released when the file is closed
+            yield
+
+    def _save(self):
+        with self._lock():
+            # Keep the entries that other processes saved since the index was loaded
+            for digest, regions in self._read().items():
+                entry = self._entries.setdefault(digest, {})
+                for region_key, stats in regions.items():
+                    entry.setdefault(region_key, stats)
+
+            # Write a temporary file with a unique name and rename it, so a crash never leaves a partial index
+            handle, temp_path = tempfile.mkstemp(prefix=f'{self.INDEX_FILE}.', suffix='.tmp',
+                                                 dir=os.path.dirname(self.index_path))
+            try:
+                with os.fdopen(handle, 'w', encoding='utf-8') as file:
+                    json.dump(self._entries, file, indent=1, sort_keys=True)
+                os.replace(temp_path, self.index_path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+    def get(self, digest, image, box):
+        # The region is part of the key, the title box and the resized background depend on the template
+        region_key = f'{image.width}x{image.height}:{",".join(str(value) for value in box)}'
+
+        regions = self._load().setdefault(digest, {})
+        stats = regions.get(region_key)
+        if stats is None:
+            stats = analyze_region(image, box)
+            regions[region_key] = stats
+            self._save()
+
+        return stats
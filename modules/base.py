@@ -1,7 +1,14 @@
+import atexit
 import csv
 import os
 import random
-from time import sleep
+import weakref
+from itertools import islice
+from time import monotonic, sleep
+
+from modules.records import (BoardRecord, CreatedBoardRecord, GeneratorDataRecord, ImagePromptRecord,
+                             UploadingDataRecord, VideoPromptRecord, WriterRetryRecord)
+from modules.row_index import CsvRowIndex
 
 
 class Pinterest:
@@ -12,6 +19,12 @@ class Pinterest:
     UPLOADED_FILE = 'uploaded.csv'
     BOARDS_FILE = 'boards.csv'
     CREATED_BOARDS_FILE = 'created_boards.csv'
+    UPLOAD_LEDGER_FILE = 'uploaded_ledger.txt'
+    PROJECT_DB_FILE = 'project.db'
+    VALIDATION_REPORT_FILE = 'validation_report.csv'
+    GENERATION_CHECKPOINT_FILE = 'generation_checkpoint.json'
+    PROMPT_CACHE_FILE = 'prompt_cache.db'
+    WRITER_RETRY_FILE = 'writer_retry_queue.csv'
 
     WRITER_MODE_1 = 'video'
     WRITER_MODE_2 = 'image'
@@ -23,6 +36,35 @@ class Pinterest:
     UPLOADER_MODE_1 = 'requests'
     UPLOADER_MODE_2 = 'selenium'
 
+    STORAGE_MODE_1 = 'csv'
+    STORAGE_MODE_2 = 'sqlite'
+
+    # Record type of each readable CSV file, its slots are the columns in the order they appear in the file
+    CSV_RECORDS = {
+        VIDEO_PROMPTS_FILE: VideoPromptRecord,
+        IMAGE_PROMPTS_FILE: ImagePromptRecord,
+        GENERATOR_DATA_FILE: GeneratorDataRecord,
+        UPLOADING_DATA_FILE: UploadingDataRecord,
+        UPLOADED_FILE: UploadingDataRecord,
+        BOARDS_FILE: BoardRecord,
+        CREATED_BOARDS_FILE: CreatedBoardRecord,
+        WRITER_RETRY_FILE: WriterRetryRecord,
+    }
+
+    # Columns of each readable CSV file
+    CSV_SCHEMAS = {filename: record_type.__slots__ for filename, record_type in CSV_RECORDS.items()}
+
+    # Header of each writable CSV file
+    CSV_HEADERS = {
+        UPLOADING_DATA_FILE: ('mode', 'keyword', 'title', 'description', 'file_path', 'board_name', 'pin_link'),
+        UPLOADED_FILE: ('mode', 'keyword', 'title', 'description', 'file_path', 'board_name', 'pin_link'),
+        GENERATOR_DATA_FILE: ('mode', 'keyword', 'title', 'description', 'tips', 'file_path', 'board_name',
+                              'pin_link'),
+        CREATED_BOARDS_FILE: ('board_name', 'board_id'),
+        VALIDATION_REPORT_FILE: ('row', 'keyword', 'title', 'problem', 'details'),
+        WRITER_RETRY_FILE: ('mode', 'keyword', 'title_prompt', 'description_prompt', 'tips_prompt', 'error'),
+    }
+
     def __init__(self, project_folder):
         self.project_path = os.path.join(os.path.abspath('projects'), project_folder)
         self.prompts_path = os.path.join(self.project_path, 'prompts')
@@ -35,7 +77,19 @@ class Pinterest:
         os.makedirs(self.pinned_path, exist_ok=True)
         os.makedirs(self.data_path, exist_ok=True)
 
+        # Long-lived appenders opened by _get_appender, keyed by file name
+        self._appenders = {}
+
     def open_csv(self, filename):
+        # Collect all rows produced by the streaming reader into a list
+        return list(self.iter_csv(filename))
+
+    def iter_csv(self, filename):
+        # Look up the record type of the file in the schema registry
+        record_type = self.CSV_RECORDS.get(filename)
+        if record_type is None:
+            raise ValueError(f"Invalid filename: {filename}. Check the available file names in the base class.")
+
         # Get the path to the data file
         data_file_path = self._get_data_file_path(filename)
 
@@ -43,119 +97,128 @@ class Pinterest:
         if not os.path.exists(data_file_path):
             raise FileNotFoundError(f"File {filename} not found: {data_file_path}")
 
-        # Check the delimiter used in the CSV file
-        delimiter = self._check_csv_delimiter(data_file_path)
+        # Return a generator that yields the rows lazily
+        return self._iter_rows(data_file_path, record_type)
+
+    def sample_csv(self, filename, count, shuffle=True, exclude=()):
+        # Look up the record type of the file in the schema registry
+        record_type = self.CSV_RECORDS.get(filename)
+        if record_type is None:
+            raise ValueError(f"Invalid filename: {filename}. Check the available file names in the base class.")
+
+        # Get the path to the data file
+        data_file_path = self._get_data_file_path(filename)
+
+        # Check if the file exists
+        if not os.path.exists(data_file_path):
+            raise FileNotFoundError(f"File {filename} not found: {data_file_path}")
 
-        # Initialize an empty list to store the result
         result = []
 
+        # Open the offset index of the file, it is updated incrementally if the file has grown
+        with CsvRowIndex(data_file_path) as index:
+            delimiter = self._sniff_delimiter(index.heading.decode('utf-8'))
+            positions = self._iter_positions(len(index), shuffle)
+
+            # Parse only the drawn rows until enough rows that are not excluded are collected
+            while len(result) < count:
+                batch = list(islice(positions, count - len(result)))
+                if not batch:
+                    break
+
+                for row in index.read_rows(batch, delimiter):
+                    record = record_type(*row)
+                    if record.get('file_path') not in exclude:
+                        result.append(record)
+
+        return result
+
+    @staticmethod
+    def _iter_positions(total, shuffle):
+        if not shuffle:
+            # Take the rows in file order
+            yield from range(total)
+            return
+
+        # Draw random positions without repetition while collisions are rare
+        drawn = set()
+        while len(drawn) < total // 2:
+            position = random.randrange(total)
+            if position not in drawn:
+                drawn.add(position)
+                yield position
+
+        # Shuffle the remaining positions once most of the rows have been drawn
+        remaining = [position for position in range(total) if position not in drawn]
+        random.shuffle(remaining)
+        yield from remaining
+
+    def _iter_rows(self, data_file_path, record_type):
         # Open the CSV file for reading
         with open(data_file_path, 'r', encoding='utf-8', newline='') as data:
-            # Read the heading (first row) from the CSV file
-            heading = next(data)
+            # Read the heading (first row) and detect the delimiter from it
+            heading = data.readline()
+            delimiter = self._sniff_delimiter(heading)
 
-            # Create a CSV reader object with the specified delimiter
+            # Create a CSV reader object with the detected delimiter
             reader = csv.reader(data, delimiter=delimiter)
 
-            # Iterate over each row in the CSV file
+            # Yield a compact record for each row
             for row in reader:
-                # Create a dictionary based on the row contents, depending on the filename
-                if filename == self.VIDEO_PROMPTS_FILE:
-                    row_dict = {
-                        'keyword': row[0],
-                        'title_prompt': row[1],
-                        'description_prompt': row[2]
-                    }
-                    result.append(row_dict)
-                elif filename == self.IMAGE_PROMPTS_FILE:
-                    row_dict = {
-                        'keyword': row[0],
-                        'title_prompt': row[1],
-                        'description_prompt': row[2],
-                        'tips_prompt': row[3]
-                    }
-                    result.append(row_dict)
-                elif filename == self.GENERATOR_DATA_FILE:
-                    row_dict = {
-                        'mode': row[0],
-                        'keyword': row[1],
-                        'title': row[2],
-                        'description': row[3],
-                        'tips': row[4]
-                    }
-                    result.append(row_dict)
-                elif filename == self.UPLOADING_DATA_FILE:
-                    row_dict = {
-                        'mode': row[0],
-                        'keyword': row[1],
-                        'title': row[2],
-                        'description': row[3],
-                        'file_path': row[4],
-                        'board_name': row[5],
-                        'pin_link': row[6],
-                    }
-                    result.append(row_dict)
-                elif filename == self.BOARDS_FILE:
-                    row_dict = {
-                        'board_name': row[0],
-                        'board_description': row[1]
-                    }
-                    result.append(row_dict)
-                else:
-                    raise ValueError(f"Invalid filename: {filename}. Check the available file names in the base class.")
-
-        # Return the list of dictionaries representing the CSV data
-        return result
+                # Skip empty lines
+                if not row:
+                    continue
+                yield record_type(*row)
 
     def write_csv(self, data, filename):
+        # Append a single row through a short-lived appender
+        with self.open_appender(filename) as appender:
+            appender.write(data)
+
+    def open_appender(self, filename, buffer_size=100, flush_interval=5.0, fsync=False):
+        # Look up the header of the file in the header registry
+        header = self.CSV_HEADERS.get(filename)
+        if header is None:
+            raise ValueError(f"Invalid filename: {filename}. Check the available file names in the base class.")
+
         # Get the full path for the data file
         data_file_path = self._get_data_file_path(filename)
 
-        file_exists = os.path.isfile(data_file_path)
-        file_empty = os.path.exists(data_file_path) and os.stat(data_file_path).st_size == 0
+        return CsvAppender(data_file_path, header, buffer_size=buffer_size, flush_interval=flush_interval,
+                           fsync=fsync)
 
-        header = []
-        if filename == self.UPLOADING_DATA_FILE or filename == self.UPLOADED_FILE:
-            header = ['mode', 'keyword', 'title', 'description', 'file_path', 'board_name', 'pin_link']
-        elif filename == self.GENERATOR_DATA_FILE:
-            header = ['mode', 'keyword', 'title', 'description', 'tips', 'file_path', 'board_name', 'pin_link']
-        elif filename == self.CREATED_BOARDS_FILE:
-            header = ['board_name', 'board_id']
+    def _get_appender(self, filename):
+        # Reuse the appender that is already open for this file, or open a new one
+        if filename not in self._appenders:
+            self._appenders[filename] = self.open_appender(filename).open()
+        return self._appenders[filename]
 
-        # Write the header if the file is empty
-        if not file_exists or file_empty:
-            self._write_header(data_file_path, header)
+    def close_appenders(self):
+        # Flush and close all appenders opened by _get_appender
+        for appender in self._appenders.values():
+            appender.close()
+        self._appenders.clear()
 
-        # Open the data file for appending and write the data using the DictWriter
-        with open(data_file_path, 'a', encoding='utf-8', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=header, delimiter=';')
-            writer.writerow(data)
-
-        # Log a success message after writing the data
-        self._log_message(f'Data has been successfully written to {filename}.\n')
+    @classmethod
+    def _check_csv_delimiter(cls, file_path):
+        # Open the file in read mode and check the first line
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return cls._sniff_delimiter(file.readline())
 
     @staticmethod
-    def _write_header(file_path, header):
-        with open(file_path, 'a', encoding='utf-8', newline='') as f:
-            writer = csv.writer(f, delimiter=';')
-            writer.writerow(header)
+    def _sniff_delimiter(first_line):
+        # Remove leading/trailing whitespaces
+        first_line = first_line.strip()
 
-    @staticmethod
-    def _check_csv_delimiter(file_path):
-        # Open the file in read mode
-        with open(file_path, 'r') as file:
-            # Read the first line and remove leading/trailing whitespaces
-            first_line = file.readline().strip()
-
-            # Check for the presence of a comma (',') as the delimiter
-            if ',' in first_line:
-                return ','
-            # Check for the presence of a semicolon (';') as the delimiter
-            elif ';' in first_line:
-                return ';'
-            # If neither comma nor semicolon is found, default to comma
-            else:
-                return ','
+        # Check for the presence of a comma (',') as the delimiter
+        if ',' in first_line:
+            return ','
+        # Check for the presence of a semicolon (';') as the delimiter
+        elif ';' in first_line:
+            return ';'
+        # If neither comma nor semicolon is found, default to comma
+        else:
+            return ','
 
     def _get_data_file_path(self, filename):
         if filename in [self.VIDEO_PROMPTS_FILE, self.IMAGE_PROMPTS_FILE]:
@@ -185,3 +248,105 @@ class Pinterest:
         if not no_print:
             print(f'\nTimeout {time_out} seconds...\n')
         sleep(time_out)
+
+
+# Appenders with an open file, their buffered rows are written when the interpreter exits
+_OPEN_APPENDERS = weakref.WeakSet()
+
+
+@atexit.register
+def _close_open_appenders():
+    # Callers that exit without closing their appenders do not lose the buffered rows
+    for appender in list(_OPEN_APPENDERS):
+        appender.close()
+
+
+class CsvAppender:
+    def __init__(self, file_path, header, delimiter=';', buffer_size=100, flush_interval=5.0, fsync=False):
+        self.file_path = file_path
+        self.header = tuple(header)
+        self.delimiter = delimiter
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self.rows_written = 0
+
+        self._file = None
+        self._writer = None
+        self._buffer = []
+        self._last_flush = monotonic()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self):
+        if self._file is None:
+            # Open the data file for appending and keep the handle for the lifetime of the appender
+            self._file = open(self.file_path, 'a', encoding='utf-8', newline='')
+            self._writer = csv.writer(self._file, delimiter=self.delimiter)
+
+            # Write the header once if the file is new or empty
+            if self._file.tell() == 0:
+                self._writer.writerow(self.header)
+
+            self._last_flush = monotonic()
+            _OPEN_APPENDERS.add(self)
+        return self
+
+    def write(self, data):
+        if self._file is None:
+            self.open()
+
+        # Buffer the row values in header order
+        self._buffer.append([data.get(column, '') for column in self.header])
+
+        # Flush when the buffer is full or the flush interval has passed
+        if len(self._buffer) >= self.buffer_size or monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        if self._file is None:
+            return
+
+        if self._buffer:
+            # Write all buffered rows at once
+            self._writer.writerows(self._buffer)
+            self.rows_written += len(self._buffer)
+            self._buffer.clear()
+
+        # Push the data to the operating system and optionally to the disk
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+        self._last_flush = monotonic()
+
+    def sync(self):
+        # Flush the buffered rows and wait until they are on the disk
+        self.flush()
+        if self._file is not None and not self.fsync:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is None:
+            return
+
+        self.flush()
+        self._file.close()
+        self._file = None
+        self._writer = None
+        _OPEN_APPENDERS.discard(self)
+
+        # Log a summary message once instead of a message for every row
+        if self.rows_written:
+            Pinterest._log_message(f'{self.rows_written} rows have been successfully written to '
+                                   f'{os.path.basename(self.file_path)}.\n')
+            self.rows_written = 0
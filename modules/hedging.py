@@ -0,0 +1,185 @@
+import time
+from bisect import bisect_left, insort
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Event, Lock
+
+
+class LatencyHistogram:
+    # Latencies of the recent calls, the oldest ones are dropped so the percentiles follow the backend
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self._sorted = []
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        with self._lock:
+            if len(self._samples) == self._samples.maxlen:
+                # Remove the oldest sample from the sorted list too
+                del self._sorted[bisect_left(self._sorted, self._samples[0])]
+            self._samples.append(seconds)
+            insort(self._sorted, seconds)
+
+    def percentile(self, percent):
+        with self._lock:
+            if not self._sorted:
+                return None
+            index = min(len(self._sorted) - 1, int(len(self._sorted) * percent / 100))
+            return self._sorted[index]
+
+
+class CallCancelled(Exception):
+    # Raised in a copy of a hedged call after the other copy has answered
+    pass
+
+
+class HedgedCopy:
+    # One copy of a hedged call. The function of the call runs the backend through run(), so only the backend call is
+    # measured, and stops retrying once the copy is cancelled.
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.started = Event()  # Set when the backend call begins, or when the copy finishes without it
+        self.cancelled = Event()
+        self.started_at = None
+        self.finished_at = None
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise CallCancelled()
+
+    def run(self, function, *args):
+        self.check()
+        self.started_at = time.monotonic()
+        self.started.set()
+
+        result = function(*args)
+
+        # Every answered copy is measured, also the ones that lost
+        self.finished_at = time.monotonic()
+        self.histogram.record(self.finished_at - self.started_at)
+        return result
+
+
+class HedgedCaller:
+    # Sends a second copy of a call that is slower than the given percentile of the recent calls of its backend,
+    # the first answer wins and the other copy is cancelled: it stops retrying, and its answer is dropped if the
+    # backend call is already running
+    def __init__(self, percentile=95, min_samples=20, max_hedge_ratio=0.1, min_delay=0.0, max_workers=32,
+                 window=500):
+        self.percentile = percentile
+        self.min_samples = min_samples  # Calls of a backend measured before its calls are hedged
+        self.max_hedge_ratio = max_hedge_ratio  # Share of the calls that may be hedged, it limits the extra load
+        self.min_delay = min_delay  # Shortest wait before a hedge, in seconds
+        self.window = window
+
+        self.calls = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.saved_seconds = 0.0
+
+        self._histograms = {}
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='Hedge')
+
+    def close(self):
+        # Do not wait for the losing copies that are still running
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_histogram(self, backend_name):
+        with self._lock:
+            if backend_name not in self._histograms:
+                self._histograms[backend_name] = LatencyHistogram(self.window)
+            return self._histograms[backend_name]
+
+    def _get_hedge_delay(self, histogram):
+        if len(histogram) < self.min_samples:
+            return None
+
+        with self._lock:
+            # Keep the hedges within their share of the calls
+            if self.hedges >= self.calls * self.max_hedge_ratio:
+                return None
+
+        return max(self.min_delay, histogram.percentile(self.percentile))
+
+    def _submit(self, histogram, function, args):
+        copy = HedgedCopy(histogram)
+        future = self._executor.submit(function, copy, *args)
+
+        # A copy that ends before its backend call, e.g. with an error of the rate limiter, does not block the wait
+        future.add_done_callback(lambda _: copy.started.set())
+        return copy, future
+
+    def call(self, backend_name, function, *args):
+        # The function is called as function(copy, *args) and runs the backend call through copy.run
+        histogram = self.get_histogram(backend_name)
+        delay = self._get_hedge_delay(histogram)
+
+        with self._lock:
+            self.calls += 1
+
+        primary, primary_future = self._submit(histogram, function, args)
+        if delay is None:
+            return primary_future.result()
+
+        # The delay counts from the start of the backend call, the time waiting for a request token
+        # or a free slot does not make a call slow
+        primary.started.wait()
+        if primary.started_at is not None:
+            delay -= time.monotonic() - primary.started_at
+
+        done, _ = wait([primary_future], timeout=max(0.0, delay))
+        if done:
+            return primary_future.result()
+
+        # The call is slower than most calls of the backend, send a copy of it
+        with self._lock:
+            self.hedges += 1
+        hedge, hedge_future = self._submit(histogram, function, args)
+
+        copies = {primary_future: primary, hedge_future: hedge}
+        pending = set(copies)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    # Wait for the other copy, the call fails only if both copies fail
+                    error = error or future.exception()
+                    continue
+
+                winner = copies[future]
+                for loser_future in pending:
+                    # Stop the losing copy, it releases its slot and does not retry
+                    loser = copies[loser_future]
+                    loser.cancelled.set()
+                    if future is hedge_future:
+                        # Measure what the hedge saved when the first copy answers
+                        loser_future.add_done_callback(lambda _, loser=loser: self._add_saved_time(winner, loser))
+
+                if future is hedge_future:
+                    with self._lock:
+                        self.hedges_won += 1
+                return future.result()
+
+        raise error
+
+    def _add_saved_time(self, winner, loser):
+        if loser.finished_at is None:
+            return
+        with self._lock:
+            self.saved_seconds += max(0.0, loser.finished_at - winner.finished_at)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'hedges': self.hedges,
+                'hedges_won': self.hedges_won,
+                'saved_seconds': self.saved_seconds,
+                'delays': {backend_name: histogram.percentile(self.percentile)
+                           for backend_name, histogram in self._histograms.items()},
+            }
@@ -1,22 +1,376 @@
 import datetime
+import hashlib
+import json
+import math
 import os
 import random
 import re
-
-from PIL import Image, ImageDraw, ImageFont, ImageColor
-
+import shutil
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from queue import Queue
+from threading import Lock, Thread
+
+from PIL import Image, ImageDraw, ImageFont
+
+from modules.background_index import BackgroundLuminanceIndex, contrast_ratio, relative_luminance
 from modules.base import Pinterest
 from modules.settings import Template1Settings, Template2Settings
+from modules.template_spec import (BoxedTitlePlan, TitlePlan, compile_template_spec, load_template_spec,
+                                   template_1_spec, template_2_spec)
+from modules.text_layout import get_layout_engine
+
+
+class FontCache:
+    def __init__(self, max_size=64):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._fonts = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, path, size, index=0):
+        key = (path, size, index)
+
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                # Mark the font as recently used
+                self._fonts.move_to_end(key)
+                self.hits += 1
+                return font
+
+            self.misses += 1
+
+        # Parse the font file only on a cache miss
+        font = ImageFont.truetype(path, size, index=index)
+
+        with self._lock:
+            self._fonts[key] = font
+            # Drop the least recently used fonts when the cache is full
+            while len(self._fonts) > self.max_size:
+                self._fonts.popitem(last=False)
+
+        return font
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._fonts)}
+
+
+# Fonts shared by all image generators of the process
+FONT_CACHE = FontCache()
+
+# Content digests of font and background files, kept until the file changes
+_FILE_DIGESTS = {}
+
+
+def file_digest(path):
+    stat = os.stat(path)
+    cached = _FILE_DIGESTS.get(path)
+    if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+
+    # Hash the file in chunks, so large backgrounds are not read into memory at once
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    _FILE_DIGESTS[path] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+    return digest.hexdigest()
+
+
+class BackgroundCache:
+    def __init__(self, folder_path, max_bytes=256 * 1024 * 1024):
+        self.folder_path = folder_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.current_bytes = 0
+
+        self._files = []
+        self._folder_mtime = None
+        self._images = OrderedDict()
+
+    def get_files(self):
+        # Rescan the folder only when its modification time has changed
+        folder_mtime = os.stat(self.folder_path).st_mtime_ns
+        if folder_mtime != self._folder_mtime:
+            self._files = BaseImageGenerator._get_background_files(self.folder_path)
+            self._folder_mtime = folder_mtime
+
+            # Drop the decoded images of the files that were removed from the folder
+            files = set(self._files)
+            for key in [key for key in self._images if key[0] not in files]:
+                self._evict(key)
+
+        return self._files
+
+    def get(self, filename, width=None):
+        key = (filename, width)
+
+        entry = self._images.get(key)
+        if entry is not None:
+            # Mark the image as recently used
+            self._images.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+
+        file_path = os.path.join(self.folder_path, filename)
+
+        # Open the image and convert it to RGBA mode
+        image = Image.open(file_path).convert('RGBA')
+
+        # Resize the image to the requested width while maintaining aspect ratio
+        if width:
+            height = int((width / image.width) * image.height)
+            image = image.resize((width, height))
+
+        size = image.width * image.height * 4
+
+        # Keep only the images that fit into the memory budget
+        if size <= self.max_bytes:
+            self._images[key] = (image, size)
+            self.current_bytes += size
+
+            # Drop the least recently used images while the budget is exceeded
+            while self.current_bytes > self.max_bytes:
+                self._evict(next(iter(self._images)))
+
+        return image
+
+    def _evict(self, key):
+        _, size = self._images.pop(key)
+        self.current_bytes -= size
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'images': len(self._images),
+            'bytes': self.current_bytes,
+        }
+
+
+class ImageWriter:
+    # Pillow format names of the supported output formats
+    FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+    def __init__(self, image_format='png', dpi=(72, 72), compress_level=6, quality=90, optimize=False,
+                 queue_size=4):
+        self.format = self.FORMATS.get(image_format.lower())
+        if self.format is None:
+            raise ValueError(f"Invalid image format: {image_format}. Available formats: {', '.join(self.FORMATS)}.")
+
+        # Encoder options of the output format
+        if self.format == 'PNG':
+            self.save_params = {'dpi': dpi, 'compress_level': compress_level, 'optimize': optimize}
+        elif self.format == 'JPEG':
+            self.save_params = {'dpi': dpi, 'quality': quality, 'optimize': optimize}
+        else:
+            self.save_params = {'quality': quality, 'method': 6 if optimize else 4}
+
+        # Images are encoded on a background thread, 0 encodes them in the calling thread
+        self.queue_size = queue_size
+
+        self.images_written = 0
+        self.images_linked = 0
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+
+        self._queue = None
+        self._thread = None
+        self._error = None
+        self._lock = Lock()
+
+    def _prepare_image(self, image):
+        # Drop the alpha channel if every pixel is opaque, JPEG cannot store it at all
+        if image.mode == 'RGBA' and (self.format == 'JPEG' or image.getchannel('A').getextrema()[0] == 255):
+            return image.convert('RGB')
+        return image
+
+    @staticmethod
+    def link_file(source_path, file_path):
+        # Nothing to do if the file is already a link to the source, for example when a run is resumed
+        if os.path.exists(file_path) and os.path.samefile(source_path, file_path):
+            return
+
+        # Hard-link the file, or copy it if the paths are on different file systems.
+        # The link is created under a temporary name and renamed, so it replaces an existing file atomically.
+        temp_path = f'{file_path}.{os.getpid()}.tmp'
+        try:
+            os.link(source_path, temp_path)
+        except OSError:
+            shutil.copy2(source_path, temp_path)
+        os.replace(temp_path, file_path)
+
+    def _save(self, task):
+        image, file_path, image_number, callback, source_path = task
+
+        if source_path is not None:
+            # The image was rendered before, so the existing file is reused instead of encoding the canvas
+            self.link_file(source_path, file_path)
+            file_size = os.path.getsize(file_path)
+
+            with self._lock:
+                self.images_linked += 1
+
+            Pinterest._log_message(f'{image_number} Image successfully reused from the render cache')
+
+            if callback is not None:
+                callback(file_size, 0.0)
+            return
+
+        start = time.perf_counter()
+        self._prepare_image(image).save(file_path, self.format, **self.save_params)
+        encode_seconds = time.perf_counter() - start
+        file_size = os.path.getsize(file_path)
+
+        with self._lock:
+            self.images_written += 1
+            self.bytes_written += file_size
+            self.encode_seconds += encode_seconds
+
+        # Log a success message with the size and the encode time of the image
+        Pinterest._log_message(f'{image_number} Image successfully saved '
+                               f'({file_size / 1024:.0f} KB, encoded in {encode_seconds * 1000:.0f} ms)')
+
+        if callback is not None:
+            callback(file_size, encode_seconds)
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                self._save(task)
+            except Exception as error:
+                # Keep the first error, it is raised in the thread that writes the next image
+                if self._error is None:
+                    self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _submit(self, task):
+        self._raise_error()
+
+        if self.queue_size <= 0:
+            self._save(task)
+            return
+
+        if self._thread is None:
+            self._queue = Queue(maxsize=self.queue_size)
+            self._thread = Thread(target=self._run, name='ImageWriter', daemon=True)
+            self._thread.start()
+
+        # The queue is bounded, so rendering waits here if encoding falls behind
+        self._queue.put(task)
+
+    def write(self, image, file_path, image_number, callback=None):
+        # The caller keeps drawing on its canvas, so a queued write gets its own copy
+        if self.queue_size > 0:
+            image = image.copy()
+        self._submit((image, file_path, image_number, callback, None))
+
+    def link(self, source_path, file_path, image_number, callback=None):
+        # Links go through the same queue as the writes, so the callbacks run in the same order and thread
+        self._submit((None, file_path, image_number, callback, source_path))
+
+    def flush(self):
+        # Wait until all queued images are written
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._queue = None
+        self._raise_error()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'images': self.images_written,
+                'linked': self.images_linked,
+                'bytes': self.bytes_written,
+                'encode_seconds': self.encode_seconds,
+            }
+
+
+@dataclass
+class RenderResult:
+    image_number: int
+    file_path: str = None
+    title_font_size: int = None
+    # Filled in when the image has been encoded, which may happen on the writer thread
+    bytes_written: int = None
+    encode_seconds: float = None
+    # True if the image was reused from the render cache
+    cached: bool = False
+    # Name of the output variant, None if the generator has no variants
+    variant: str = None
+    # Results of the other output variants of the row
+    variants: list = field(default_factory=list)
+
+
+@dataclass
+class OutputVariant:
+    name: str
+    width: int
+    height: int
+
+    @property
+    def aspect_ratio(self):
+        # Reduced width and height, variants with the same ratio share one layout
+        divisor = math.gcd(self.width, self.height)
+        return self.width // divisor, self.height // divisor
+
+
+def group_variants(variants):
+    # Group the variants by aspect ratio in the order they are given, the largest variant of a group comes first
+    groups = {}
+    for variant in variants:
+        groups.setdefault(variant.aspect_ratio, []).append(variant)
+    return [sorted(group, key=lambda variant: variant.width * variant.height, reverse=True)
+            for group in groups.values()]
 
 
 class BaseImageGenerator(Pinterest):
     TEMPLATES = ['template_1', 'template_2']
     SUBFOLDERS = ['fonts']
 
-    def __init__(self, project_folder, template, width=1000, height=1500, image_format='png', dpi=(72, 72),
-                 save=True, show=True, write_uploading_data=False):
+    # Extra pixels around the elements drawn on a region-sized layer
+    LAYER_MARGIN = 2
+
+    def __init__(self, project_folder, spec, width=1000, height=1500, image_format='png', dpi=(72, 72),
+                 save=True, show=True, write_uploading_data=False, bg_cache_bytes=256 * 1024 * 1024,
+                 compress_level=6, quality=90, optimize=False, writer_queue_size=4, render_cache=False,
+                 variants=None):
         super().__init__(project_folder)
-        self.template = template
+        self.project_folder = project_folder
         self.width = width
         self.height = height
         self.image_format = image_format
@@ -32,6 +386,37 @@ class BaseImageGenerator(Pinterest):
         os.makedirs(self.backgrounds_path, exist_ok=True)
         os.makedirs(self.save_image_path, exist_ok=True)
 
+        # Output sizes written for every row, each aspect ratio is drawn once at its largest size.
+        # Without variants a single image of width x height is written.
+        self.variants = [variant if isinstance(variant, OutputVariant) else OutputVariant(*variant)
+                         for variant in variants or ()]
+        self._variant_groups = group_variants(self.variants) if self.variants else [[None]]
+        # The row is complete once the last variant is saved
+        self._last_variant = self._variant_groups[-1][-1].name if self.variants else None
+
+        # Rendered images by the hash of everything that affects their pixels, None disables the cache
+        self.render_cache_path = os.path.join(self.project_path, 'render_cache') if render_cache else None
+
+        # Fixed part of the image file names during a resumable run, a new timestamp is used for every image otherwise
+        self.run_id = None
+        # Progress of the resumable run, updated when an image is saved
+        self._checkpoint = None
+        self._checkpoint_interval = 100
+
+        # Decoded backgrounds, kept within the memory budget
+        self.background_cache = BackgroundCache(self.backgrounds_path, bg_cache_bytes)
+        # Luminance of the title region of every background, analyzed once per background file
+        self.luminance_index = BackgroundLuminanceIndex(self.backgrounds_path)
+
+        # Encodes and saves the images while the next image is rendered
+        self.image_writer = ImageWriter(image_format, dpi, compress_level, quality, optimize, writer_queue_size)
+
+        # Parameters needed to create the same generator in a batch worker process
+        self.init_params = {'width': width, 'height': height, 'image_format': image_format, 'dpi': dpi,
+                            'bg_cache_bytes': bg_cache_bytes, 'compress_level': compress_level,
+                            'quality': quality, 'optimize': optimize, 'render_cache': render_cache,
+                            'variants': self.variants}
+
         self.assets_path = os.path.join(self.data_path, 'image_assets')
 
         for template in self.TEMPLATES:
@@ -43,17 +428,21 @@ class BaseImageGenerator(Pinterest):
                 setattr(self, f'{template}_{subfolder}_path', subfolder_path)
                 os.makedirs(subfolder_path, exist_ok=True)
 
-        self.settings = self._get_template_settings()
+        # Compile the template spec into a render plan once for the whole run
+        if isinstance(spec, str):
+            spec = load_template_spec(spec)
+        self.spec = spec
+        self.plan = compile_template_spec(spec, self.assets_path)
+        self.template = self.plan.name
+        os.makedirs(self.plan.fonts_path, exist_ok=True)
+
+        # Read the footer text once for the whole run
+        footer_text_path = os.path.join(self.project_path, 'footer_text.txt')
+        self.footer_text = self._get_footer_text(footer_text_path, self.plan.footer.text)
 
         self.canvas = Image.new("RGBA", (self.width, self.height))
 
-    def _get_template_settings(self):
-        if self.template == self.GENERATOR_MODE_1:
-            return Template1Settings()
-        elif self.template == self.GENERATOR_MODE_2:
-            return Template2Settings()
-        else:
-            raise ValueError(f"Invalid template mode: {self.template}")
+        self._build_static_layers()
 
     def _fill_background(self, color):
         # Create a drawing object to draw on the canvas
@@ -68,114 +457,198 @@ class BaseImageGenerator(Pinterest):
         return [f for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f))
                 and f.lower().endswith(('.png', '.jpg', '.jpeg'))]
 
-    def _add_gradient(self, gradient_color):
-        # Create a new RGBA image with the specified gradient color
-        gradient = Image.new('RGBA', (self.width, self.height), gradient_color)
+    def _build_static_layers(self):
+        # Layers that depend only on the render plan and the canvas size
+        self._gradient_layers = {}
+        self._footer_layers = {}
+
+        # Element layers of the row that is being rendered, shared by its variants
+        self._row_layers = {}
 
-        # Generate an alpha gradient with a linear gradient
-        alpha = Image.linear_gradient('L').rotate(self.settings.gradient_direction).resize((self.width, self.height))
+        # Build one gradient layer for every color that can be chosen for the background
+        if self.plan.background.overlay and self.plan.gradient.enabled:
+            for color in (*self.plan.background.random_colors, self.plan.background.color):
+                self._get_gradient_layer(color)
 
-        # Apply the alpha gradient to the gradient image
-        gradient.putalpha(alpha)
+    def _get_gradient_layer(self, gradient_color):
+        key = (gradient_color, self.plan.gradient.direction, self.width, self.height)
 
-        # Composite the gradient onto the canvas
-        self.canvas.alpha_composite(gradient)
+        layer = self._gradient_layers.get(key)
+        if layer is None:
+            # Create a new RGBA image with the specified gradient color
+            layer = Image.new('RGBA', (self.width, self.height), gradient_color)
+
+            # Generate an alpha gradient with a linear gradient
+            alpha = Image.linear_gradient('L').rotate(self.plan.gradient.direction).resize(
+                (self.width, self.height))
+
+            # Apply the alpha gradient to the gradient image
+            layer.putalpha(alpha)
+
+            self._gradient_layers[key] = layer
+
+        return layer
+
+    def _add_gradient(self, gradient_color):
+        # Composite the cached gradient onto the canvas
+        self.canvas.alpha_composite(self._get_gradient_layer(gradient_color))
 
-    def _draw_background(self):
-        if self.settings.overlay_bg:
-            # Get a list of files from the specified folder
-            bg_files = self._get_background_files(self.backgrounds_path)
+    def _choose_background(self, rng=None):
+        # Make the random choices of the background before drawing, so they can be part of the render key.
+        # The choices come from the given random generator, or from the global one.
+        rng = rng or random
+        background = self.plan.background
+        bg_image_name = None
+        color = None
+
+        if background.overlay:
+            # Get a list of files from the backgrounds folder, it is rescanned only when the folder changes
+            bg_files = self.background_cache.get_files()
 
             if bg_files:
                 # Choose a random image from the list of files
-                bg_image_path = os.path.join(self.backgrounds_path, random.choice(bg_files))
-
-                # Open the image and convert it to RGBA mode
-                bg_image = Image.open(bg_image_path).convert('RGBA')
-
-                # Resize the background image if the option is enabled
-                if self.settings.resize_bg:
-                    # Define the desired width for the image
-                    resized_width = self.width
-                    # Calculate the corresponding height to maintain aspect ratio
-                    resized_height = int((resized_width / bg_image.width) * bg_image.height)
-                    # Resize the image
-                    bg_image_resized = bg_image.resize((resized_width, resized_height))
-                    # Paste the resized image onto the canvas
-                    self.canvas.paste(bg_image_resized, (0, 0))
-                else:
-                    # Paste the original image onto the canvas
-                    self.canvas.paste(bg_image, (0, 0))
-
-                if self.settings.gradient:
-                    if self.settings.random_bg_color:
-                        # If random background color is enabled, choose a random color from the list
-                        random_color = random.choice(self.settings.random_colors)
-                        self._add_gradient(random_color)
-                    else:
-                        # If random background color is disabled, use the specified background color
-                        self._add_gradient(self.settings.bg_color)
-
-                return self._contains_light(bg_image_path)
+                bg_image_name = rng.choice(bg_files)
+
+                if self.plan.gradient.enabled:
+                    # Use a random gradient color from the list if random background color is enabled,
+                    # otherwise use the specified background color
+                    color = rng.choice(background.random_colors) if background.random_color else background.color
         else:
-            if self.settings.random_bg_color:
-                random_color = random.choice(self.settings.random_colors)
+            color = rng.choice(background.random_colors) if background.random_color else background.color
 
-                self._fill_background(random_color)
-            else:
-                self._fill_background(self.settings.bg_color)
+        return bg_image_name, color
+
+    def _draw_background(self, background_choice=None):
+        if background_choice is None:
+            background_choice = self._choose_background()
+        bg_image_name, color = background_choice
+
+        if self.plan.background.overlay:
+            if bg_image_name is not None:
+                # Get the decoded RGBA image, resized if the option is enabled
+                resized_width = self.width if self.plan.background.resize else None
+                bg_image = self.background_cache.get(bg_image_name, resized_width)
+                contains_light = self._is_light_background(bg_image_name, bg_image)
+
+                # Paste the image onto the canvas
+                self.canvas.paste(bg_image, (0, 0))
+
+                if color is not None:
+                    self._add_gradient(color)
+
+                return contains_light
+        else:
+            self._fill_background(color)
 
     @staticmethod
     def _contains_light(filename):
-        base_name = os.path.basename(filename)
-        return 'light' in base_name.lower()
+        # The file name overrides the analysis, "light" backgrounds get the title color for light backgrounds
+        # and "dark" ones the default title color
+        base_name = os.path.basename(filename).lower()
+        if 'light' in base_name:
+            return True
+        if 'dark' in base_name:
+            return False
+        return None
+
+    def _get_title_region(self, bg_image):
+        # Box of the first title on the background, the title color is chosen for this region
+        for element in self.plan.elements:
+            if isinstance(element, TitlePlan):
+                left = max(0, (self.width - element.max_width) // 2)
+                top = max(0, element.margin_from_top)
+                right = min(bg_image.width, left + element.max_width)
+                bottom = min(bg_image.height, top + element.max_height)
+                if right <= left or bottom <= top:
+                    return None
+                return (left, top, right, bottom), element
+        return None
+
+    def _is_light_background(self, bg_image_name, bg_image):
+        contains_light = self._contains_light(bg_image_name)
+        if contains_light is not None or not self.plan.background.analyze_luminance:
+            return bool(contains_light)
+
+        region = self._get_title_region(bg_image)
+        if region is None:
+            return False
+        box, element = region
+
+        # The statistics are read from the index, a background is analyzed only the first time it is used
+        digest = file_digest(os.path.join(self.backgrounds_path, bg_image_name))
+        luminance = self.luminance_index.get(digest, bg_image, box)['mean']
+
+        # The background is light if the title color for light backgrounds has the higher contrast on it
+        return (contrast_ratio(relative_luminance(element.color_on_light), luminance) >
+                contrast_ratio(relative_luminance(element.color), luminance))
+
+    def _get_layer_bounds(self, boxes):
+        # Bounding box of all elements, with a small margin for antialiasing
+        return (math.floor(min(box[0] for box in boxes)) - self.LAYER_MARGIN,
+                math.floor(min(box[1] for box in boxes)) - self.LAYER_MARGIN,
+                math.ceil(max(box[2] for box in boxes)) + self.LAYER_MARGIN + 1,
+                math.ceil(max(box[3] for box in boxes)) + self.LAYER_MARGIN + 1)
+
+    def _create_layer(self, *boxes):
+        # Bounding box of all elements limited to the canvas
+        left, top, right, bottom = self._get_layer_bounds(boxes)
+        left, top, right, bottom = max(0, left), max(0, top), min(self.width, right), min(self.height, bottom)
+
+        # Nothing to draw if the elements are outside of the canvas
+        if right <= left or bottom <= top:
+            return None, (left, top)
+
+        # Create a transparent layer of the size of the bounding box
+        layer = Image.new('RGBA', (right - left, bottom - top), (0, 0, 0, 0))
+        return layer, (left, top)
+
+    def _composite_layer(self, key, draw_layer, *boxes):
+        # Draw the elements with draw_layer(draw, offset_x, offset_y) on a region-sized layer
+        # and composite it onto the canvas
+        layer, (offset_x, offset_y) = self._create_layer(*boxes)
+        if layer is None:
+            return
+
+        # A layer that is not cut by the canvas edges looks the same wherever it is placed. The variants of a row
+        # with another aspect ratio reuse it when the elements only moved, so their text is not rasterized again.
+        reusable = (offset_x, offset_y, offset_x + layer.width, offset_y + layer.height) == \
+            self._get_layer_bounds(boxes)
+        if reusable:
+            key = (key, tuple(self._shift_box(box, offset_x, offset_y) for box in boxes))
+            cached = self._row_layers.get(key)
+            if cached is not None:
+                self.canvas.alpha_composite(cached, dest=(offset_x, offset_y))
+                return
+
+        draw_layer(ImageDraw.Draw(layer), offset_x, offset_y)
+        if reusable:
+            self._row_layers[key] = layer
+
+        # Composite the layer onto the canvas at its position
+        self.canvas.alpha_composite(layer, dest=(offset_x, offset_y))
 
     @staticmethod
-    def _wrap_text(text, font, max_width):
-        lines = []  # List to store the wrapped lines of text
-        words = text.split()  # Split the input text into words
-        current_line = words[0]  # Initialize the current line with the first word
-
-        # Iterate over the remaining words
-        for word in words[1:]:
-            test_line = current_line + " " + word  # Append the next word to the current line
-            bbox = font.getbbox(test_line)  # Get the bounding box of the test line
-
-            # Check if the width of the test line exceeds the maximum width
-            if bbox[2] - bbox[0] <= max_width:
-                current_line = test_line  # If within limit, update the current line
-            else:
-                lines.append(current_line)  # If exceeds, add the current line to the list
-                current_line = word  # Start a new line with the current word
+    def _shift_box(box, offset_x, offset_y):
+        return box[0] - offset_x, box[1] - offset_y, box[2] - offset_x, box[3] - offset_y
 
-        lines.append(current_line)  # Add the last line to the list
-        return '\n'.join(lines)  # Join the wrapped lines with line breaks and return as a single string
+    def _get_footer_layer(self, text, font_path):
+        key = (text, font_path, self.width, self.height)
 
-    @staticmethod
-    def _color_with_alpha(color, alpha):
-        r, g, b = ImageColor.getrgb(color)
-        return r, g, b, alpha
+        cached = self._footer_layers.get(key)
+        if cached is not None:
+            return cached
 
-    def _add_footer_with_text(self, text, font_path):
-        # Create a transparent canvas
-        transparent_canvas = Image.new('RGBA', self.canvas.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(transparent_canvas)
+        footer = self.plan.footer
 
-        # Load the font
-        font = ImageFont.truetype(font_path, self.settings.footer_font_size)
+        # Get the font from the shared font cache
+        font = FONT_CACHE.get(font_path, footer.font_size)
 
         # Determine the dimensions of the image
-        image_width, image_height = self.canvas.size
+        image_width, image_height = self.width, self.height
 
         # Dimensions of the footer bar
         bar_width = image_width
-        bar_start_y = image_height - self.settings.footer_height
-
-        # Convert footer fill color to RGBA format with transparency
-        footer_fill_color = self._color_with_alpha(self.settings.footer_fill_color, self.settings.footer_opacity)
-
-        # Draw the footer bar
-        draw.rectangle((0, bar_start_y, bar_width, image_height), fill=footer_fill_color)
+        bar_start_y = image_height - footer.height
 
         # Determine the dimensions of the text
         text_bbox = font.getbbox(text)
@@ -183,13 +656,28 @@ class BaseImageGenerator(Pinterest):
 
         # Calculate coordinates to center the text inside the footer bar
         text_x = (bar_width - text_width) // 2
-        text_y = bar_start_y + (self.settings.footer_height - text_height) // 2
+        text_y = bar_start_y + (footer.height - text_height) // 2 + footer.text_y_offset
+
+        # The strip covers the footer bar and the text, even if the text is shifted above the bar
+        strip_top = max(0, min(bar_start_y, text_y + text_bbox[1]))
+
+        # Create a transparent strip
+        strip = Image.new('RGBA', (image_width, image_height - strip_top), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(strip)
+
+        # Draw the footer bar, its fill color already has the footer opacity
+        draw.rectangle((0, bar_start_y - strip_top, bar_width, image_height - strip_top), fill=footer.fill_color)
 
         # Draw the text
-        draw.text((text_x, text_y + self.settings.footer_text_y_offset), text, font=font,
-                  fill=self.settings.footer_text_color)
+        draw.text((text_x, text_y - strip_top), text, font=font, fill=footer.text_color)
+
+        self._footer_layers[key] = (strip, strip_top)
+        return strip, strip_top
 
-        self.canvas.alpha_composite(transparent_canvas)
+    def _add_footer_with_text(self, text, font_path):
+        # Composite the cached footer strip onto the bottom of the canvas
+        strip, strip_top = self._get_footer_layer(text, font_path)
+        self.canvas.alpha_composite(strip, dest=(0, strip_top))
 
     @staticmethod
     def _get_footer_text(file_path, default_text):
@@ -208,12 +696,16 @@ class BaseImageGenerator(Pinterest):
             # If the file is not found, return the default value
             return default_text
 
-    def _get_file_path(self, image_number):
-        # Get the current timestamp in the specified format
-        current_time = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    def _get_file_path(self, image_number, variant=None):
+        # Get the current timestamp in the specified format, a resumable run keeps the timestamp of its start,
+        # so an image rendered again after a restart replaces its file instead of creating a duplicate
+        current_time = self.run_id or datetime.datetime.now().strftime('%Y%m%d%H%M%S')
 
-        # Create a filename incorporating the image number and current timestamp
-        filename = f'{image_number}_{current_time}.{self.image_format}'
+        # Create a filename incorporating the image number, current timestamp and the output variant
+        if variant is None:
+            filename = f'{image_number}_{current_time}.{self.image_format}'
+        else:
+            filename = f'{image_number}_{current_time}_{variant}.{self.image_format}'
 
         # Generate the full file path by joining the save image path and filename
         file_path = os.path.join(self.save_image_path, filename)
@@ -221,12 +713,9 @@ class BaseImageGenerator(Pinterest):
         # Return the complete file path
         return file_path
 
-    def save_image(self, file_path, image_number):
-        # Save the canvas as an image file with the specified DPI
-        self.canvas.save(file_path, dpi=self.dpi)
-
-        # Log a success message indicating that the image was saved
-        self._log_message(f'{image_number} Image successfully saved')
+    def save_image(self, file_path, image_number, callback=None, image=None):
+        # Hand the canvas or a resized copy of it to the image writer, it logs a message when the image is saved
+        self.image_writer.write(self.canvas if image is None else image, file_path, image_number, callback)
 
     @staticmethod
     def _get_uploading_data(data, file_path):
@@ -241,306 +730,903 @@ class BaseImageGenerator(Pinterest):
         }
         return uploading_data
 
-    def generate_image(self, data, image_number):
+    def log_cache_stats(self):
+        font_stats = FONT_CACHE.stats()
+        bg_stats = self.background_cache.stats()
+        self._log_message(f"Font cache: {font_stats['hits']} hits, {font_stats['misses']} misses.\n"
+                          f"Background cache: {bg_stats['hits']} hits, {bg_stats['misses']} misses, "
+                          f"hit rate {bg_stats['hit_rate']:.1%}, {bg_stats['images']} images, "
+                          f"{bg_stats['bytes'] / 1024 / 1024:.1f} MB.")
+
+    def _get_render_cache_path(self, data, background_choice, variant=None):
+        bg_image_name, color = background_choice
+
+        # Everything that affects the pixels or the encoding of the image
+        key_data = {
+            'spec': self.spec,
+            'size': (self.width, self.height),
+            'output_size': (variant.width, variant.height) if variant is not None else None,
+            'format': self.image_writer.format,
+            'save_params': self.image_writer.save_params,
+            'texts': [data.get(element.column, '') for element in self.plan.elements],
+            'footer_text': self.footer_text if self.plan.footer.enabled else None,
+            'background': (bg_image_name, file_digest(os.path.join(self.backgrounds_path, bg_image_name)))
+            if bg_image_name is not None else None,
+            'color': color,
+            'fonts': sorted({font_path: file_digest(font_path) for font_path, _ in self._get_font_specs()}.items()),
+        }
+        key = hashlib.sha256(json.dumps(key_data, sort_keys=True, default=list).encode('utf-8')).hexdigest()
+
+        return os.path.join(self.render_cache_path, key[:2], f'{key}.{self.image_format}')
+
+    @staticmethod
+    def _store_in_render_cache(file_path, cache_path):
+        # The link is renamed into place, so the cache never has partial files
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        ImageWriter.link_file(file_path, cache_path)
+
+    def _finish_image(self, data, result, write_uploading_data=None, cache_path=None, image=None):
+        if self.show:
+            if result.cached:
+                Image.open(cache_path).show()
+            else:
+                (self.canvas if image is None else image).show()
+
+        if not self.save:
+            return result
+
+        result.file_path = self._get_file_path(result.image_number, result.variant)
+
+        if write_uploading_data is None:
+            write_uploading_data = self.write_uploading_data
+
+        def on_saved(bytes_written, encode_seconds):
+            result.bytes_written = bytes_written
+            result.encode_seconds = encode_seconds
+
+            if cache_path is not None and not result.cached:
+                self._store_in_render_cache(result.file_path, cache_path)
+
+            # Add the image to the uploading data only once its file exists
+            if write_uploading_data:
+                uploading_data = self._get_uploading_data(data, result.file_path)
+                self._get_appender(self.UPLOADING_DATA_FILE).write(uploading_data)
+
+            if self._checkpoint is not None and result.variant == self._last_variant:
+                self._complete_row(result)
+
+        if result.cached:
+            self.image_writer.link(cache_path, result.file_path, result.image_number, on_saved)
+        else:
+            self.save_image(result.file_path, result.image_number, on_saved, image)
+
+        return result
+
+    def close(self):
+        # Wait for the queued images, then flush the uploading data rows written when they were saved
+        try:
+            self.image_writer.close()
+        finally:
+            self.close_appenders()
+
+        writer_stats = self.image_writer.stats()
+        if writer_stats['images']:
+            self._log_message(f"{writer_stats['images']} images written, "
+                              f"{writer_stats['bytes'] / 1024 / 1024:.1f} MB, average encode time "
+                              f"{writer_stats['encode_seconds'] / writer_stats['images'] * 1000:.0f} ms.")
+        if writer_stats['linked']:
+            self._log_message(f"{writer_stats['linked']} images reused from the render cache.")
+
+    def _get_content_bottom(self):
+        # Lowest point the template content can reach without running into the footer
+        return self.height - self.plan.footer.height if self.plan.footer.enabled else self.height
+
+    def _validate_row(self, data):
+        # List of (problem, details) pairs of the row, overridden in subclasses
+        raise NotImplementedError("Subclasses must implement the _validate_row method")
+
+    def validate(self, rows, start_number=1, write_report=True):
+        # Run only the layout of every row and collect the problems a render would have
+        problems = []
+        rows_count = 0
+        for number, row in enumerate(rows, start=start_number):
+            rows_count += 1
+            for problem, details in self._validate_row(row):
+                problems.append({'row': number, 'keyword': row.get('keyword', ''), 'title': row.get('title', ''),
+                                 'problem': problem, 'details': details})
+
+        if write_report:
+            # Start a new report on every run
+            report_path = self._get_data_file_path(self.VALIDATION_REPORT_FILE)
+            if os.path.exists(report_path):
+                os.remove(report_path)
+
+            with self.open_appender(self.VALIDATION_REPORT_FILE, buffer_size=1000) as appender:
+                appender.writerows(problems)
+
+        problem_rows = len({problem['row'] for problem in problems})
+        self._log_message(f'{problem_rows} of {rows_count} rows have problems, {len(problems)} problems found.')
+
+        return problems
+
+    def _get_font_specs(self):
+        # Font paths and sizes used by the elements and the footer of the template
+        font_specs = [font_spec for element in self.plan.elements for font_spec in element.get_font_specs()]
+        if self.plan.footer.enabled:
+            font_specs.append((self.plan.footer.font, self.plan.footer.font_size))
+        return font_specs
+
+    def _warm_up(self):
+        # Load the fonts of the template into the font cache
+        for font_path, font_size in self._get_font_specs():
+            FONT_CACHE.get(font_path, font_size)
+
+        # Decode the backgrounds into the background cache and analyze them
+        self._analyze_backgrounds()
+
+    def _analyze_backgrounds(self):
+        # Analyze the title regions of the backgrounds for every aspect ratio that is rendered,
+        # the results are saved in the luminance index
+        if not self.plan.background.overlay:
+            return
+
+        width, height = self.width, self.height
+        try:
+            for group in self._variant_groups:
+                if group[0] is not None:
+                    self.width, self.height = group[0].width, group[0].height
+
+                resized_width = self.width if self.plan.background.resize else None
+                for bg_image_name in self.background_cache.get_files():
+                    bg_image = self.background_cache.get(bg_image_name, resized_width)
+                    self._is_light_background(bg_image_name, bg_image)
+        finally:
+            self.width, self.height = width, height
+
+    def _get_uploading_data_size(self):
+        # Size of the uploading data file with all buffered rows on the disk. The rows are synced before the
+        # checkpoint is written, so a resumed run never truncates the file beyond the rows that survived a crash.
+        if not self.write_uploading_data:
+            return None
+
+        if self.UPLOADING_DATA_FILE in self._appenders:
+            self._appenders[self.UPLOADING_DATA_FILE].sync()
+
+        data_file_path = self._get_data_file_path(self.UPLOADING_DATA_FILE)
+        return os.path.getsize(data_file_path) if os.path.exists(data_file_path) else 0
+
+    def _load_checkpoint(self):
+        checkpoint_path = self._get_data_file_path(self.GENERATION_CHECKPOINT_FILE)
+        if not os.path.exists(checkpoint_path):
+            return None
+
+        with open(checkpoint_path, 'r', encoding='utf-8') as file:
+            checkpoint = json.load(file)
+
+        # A checkpoint of another template belongs to a different run
+        if checkpoint.get('template') != self.template:
+            self._log_message(f"The checkpoint of the {checkpoint.get('template')} template is ignored, "
+                              f"a new {self.template} run is started.")
+            return None
+
+        return checkpoint
+
+    def _save_checkpoint(self):
+        self._checkpoint['uploading_data_size'] = self._get_uploading_data_size()
+
+        # Write a temporary file and rename it, so a crash never leaves a partial checkpoint
+        checkpoint_path = self._get_data_file_path(self.GENERATION_CHECKPOINT_FILE)
+        temp_path = f'{checkpoint_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self._checkpoint, file, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, checkpoint_path)
+
+    def _complete_row(self, result):
+        # Called in row order when the image of a row has been saved
+        self._checkpoint['row'] = result.image_number
+        self._checkpoint['file_path'] = result.file_path
+
+        if result.image_number % self._checkpoint_interval == 0:
+            self._save_checkpoint()
+
+    def _start_run(self, checkpoint_interval):
+        self._checkpoint_interval = checkpoint_interval
+        checkpoint = self._load_checkpoint()
+
+        if checkpoint is None:
+            checkpoint = {'template': self.template, 'run_id': datetime.datetime.now().strftime('%Y%m%d%H%M%S'),
+                          'row': 0, 'file_path': None,
+                          'uploading_data_size': self._get_uploading_data_size()}
+        else:
+            self._log_message(f"Resuming the run {checkpoint['run_id']} after row {checkpoint['row']}: "
+                              f"{checkpoint['file_path']}")
+
+            # Remove the uploading data rows written after the checkpoint, their rows are rendered again
+            data_file_path = self._get_data_file_path(self.UPLOADING_DATA_FILE)
+            uploading_data_size = checkpoint['uploading_data_size']
+            if (self.write_uploading_data and uploading_data_size is not None and os.path.exists(data_file_path)
+                    and os.path.getsize(data_file_path) > uploading_data_size):
+                self.close_appenders()
+                os.truncate(data_file_path, uploading_data_size)
+
+        self.run_id = checkpoint['run_id']
+        self._checkpoint = checkpoint
+
+    def generate_rows(self, rows, workers=1, checkpoint_interval=100):
+        # Render a stream of rows and record the last saved row in a checkpoint file,
+        # a restart after a crash skips the saved rows and continues with the same file names
+        if not self.save and workers <= 1:
+            # Nothing is saved, so there is no progress to record
+            for number, row in enumerate(rows, start=1):
+                self.generate_image(row, number)
+            return
+
+        self._start_run(checkpoint_interval)
+        start_number = self._checkpoint['row'] + 1
+
+        # Skip the rows completed before the restart without keeping them in memory
+        rows = islice(rows, start_number - 1, None)
+
+        try:
+            if workers > 1:
+                # Render chunks of rows in the worker processes, the images are always saved in this mode.
+                # The workers are started once for the run and keep their fonts and backgrounds between the chunks.
+                with self._create_batch_executor(workers) as executor:
+                    while True:
+                        chunk = list(islice(rows, checkpoint_interval * workers))
+                        if not chunk:
+                            break
+                        results = self.generate_batch(chunk, start_number=start_number, executor=executor)
+                        self._checkpoint['row'] = results[-1].image_number
+                        self._checkpoint['file_path'] = results[-1].file_path
+                        self._save_checkpoint()
+                        start_number += len(chunk)
+            else:
+                for number, row in enumerate(rows, start=start_number):
+                    self.generate_image(row, number)
+        finally:
+            # Record the rows saved since the last checkpoint, also if the run stops with an error
+            try:
+                self.image_writer.flush()
+            finally:
+                self._save_checkpoint()
+
+        # The run is complete, so the next run starts from the first row with new file names
+        os.remove(self._get_data_file_path(self.GENERATION_CHECKPOINT_FILE))
+        self._log_message(f"The run {self.run_id} is complete, {self._checkpoint['row']} rows have been rendered.")
+        self._checkpoint = None
+        self.run_id = None
+
+    def _create_batch_executor(self, workers=None):
+        init_params = (type(self), self.project_folder, self.init_params, self.spec, self.run_id)
+
+        # Fill the luminance index before the workers start, so they only read it
+        self._analyze_backgrounds()
+
+        # Every worker creates its generator once and reuses its fonts, render plan and backgrounds
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=init_params)
+
+    def generate_batch(self, rows, workers=None, start_number=1, executor=None):
+        # The rows are rendered by the given executor of _create_batch_executor, or by workers started for the batch
+        tasks = list(enumerate(rows, start=start_number))
+
+        if executor is not None:
+            results = list(executor.map(_render_batch_worker_row, tasks))
+        elif workers == 1:
+            # Render in this process. The images are saved and not shown, like in the worker processes,
+            # so every result has its file path.
+            save, show = self.save, self.show
+            self.save, self.show = True, False
+            try:
+                results = [self._render_batch_row(task) for task in tasks]
+            finally:
+                self.save, self.show = save, show
+        else:
+            with self._create_batch_executor(workers) as executor:
+                results = list(executor.map(_render_batch_worker_row, tasks))
+
+        # Wait until the images rendered in this process are saved
+        self.image_writer.flush()
+
+        # Write the uploading data from this process in input order
+        if self.write_uploading_data:
+            appender = self._get_appender(self.UPLOADING_DATA_FILE)
+            for (_, row), result in zip(tasks, results):
+                for output in [result] + result.variants:
+                    appender.write(self._get_uploading_data(row, output.file_path))
+
+        return results
+
+    def _render_batch_row(self, task):
+        number, row = task
+
+        # Start from an empty canvas, so nothing is left over from the row the worker rendered before
+        self.canvas = Image.new('RGBA', (self.width, self.height))
+
+        return self.generate_image(row, number, write_uploading_data=False)
+
+    def _get_row_random(self, data):
+        # The random choices of a row follow from its texts, so an unchanged row gets the same design on every run
+        # and in every worker process, and its image can be taken from the render cache
+        texts = [data.get(element.column, '') for element in self.plan.elements]
+        return random.Random(hashlib.sha256(json.dumps(texts).encode('utf-8')).digest())
+
+    def generate_image(self, data, image_number, write_uploading_data=None):
+        # Render the row and return a RenderResult
         raise NotImplementedError("Subclasses must implement the generate_image method")
 
 
-class Template1ImageGenerator(BaseImageGenerator):
-    def __init__(self, project_folder, width=1000, height=1500, image_format='png', dpi=(72, 72),
-                 save=True, show=True, write_uploading_data=False):
-        template = self.GENERATOR_MODE_1
-        super().__init__(project_folder, template, width, height, image_format, dpi, save, show, write_uploading_data)
+class TemplateImageGenerator(BaseImageGenerator):
+    # Generic generator that draws the elements of a compiled template spec in order
+
+    def __init__(self, project_folder, spec, width=1000, height=1500, image_format='png', dpi=(72, 72),
+                 save=True, show=True, write_uploading_data=False, **kwargs):
+        super().__init__(project_folder, spec, width, height, image_format, dpi, save, show, write_uploading_data,
+                         **kwargs)
+
+    @staticmethod
+    def _apply_case(text, case):
+        if case == 'upper':
+            return text.upper()
+        if case == 'lower':
+            return text.lower()
+        if case == 'title':
+            return text.title()
+        return text
+
+    def _get_element_text(self, element, data):
+        return self._apply_case(data.get(element.column, ''), element.case)
+
+    def _fit_title_font_size(self, element, title_text):
+        # Binary search for the largest font size whose title block fits the title box.
+        # Every step only lays out the cached word widths, nothing is drawn.
+        low, high = element.min_font_size, element.max_font_size
+        best_size = low
+        while low <= high:
+            size = (low + high) // 2
+            width, height = self._measure_title(element, title_text, size)
+
+            if width <= element.max_width and height <= element.max_height:
+                best_size = size
+                low = size + 1
+            else:
+                high = size - 1
 
-    def _draw_title(self, title_text, font_path, contains_light):
+        # The search ends below the minimum size only if even the minimum size does not fit
+        return best_size, high >= best_size
+
+    def _get_title_font_size(self, element, title_text):
+        if not element.auto_fit:
+            return element.font_size
+
+        font_size, fits = self._fit_title_font_size(element, title_text)
+        if not fits:
+            self._log_message(f'The title does not fit the title box even at font size {font_size}: {title_text}')
+
+        return font_size
+
+    def _measure_title(self, element, title_text, font_size):
+        # Width and height of the title block of the element at the font size
+        if isinstance(element, BoxedTitlePlan):
+            return self._measure_boxed_title(element, title_text, font_size)
+
+        return self._layout_title(element, title_text, font_size)[1].get_size()
+
+    def _layout_title(self, element, title_text, font_size):
+        # Get the font from the shared font cache and wrap the text to fit within the maximum width
+        font = FONT_CACHE.get(element.font, font_size)
+        engine = get_layout_engine(font)
+
+        if element.line_case:
+            lines = [self._apply_case(line, element.line_case) for line in engine.wrap(title_text, element.max_width)]
+            return font, engine.layout_lines(lines, element.line_spacing)
+
+        return font, engine.layout(title_text, element.max_width, element.line_spacing)
+
+    def _draw_title(self, element, data, context):
         # Create a drawing object
         draw = ImageDraw.Draw(self.canvas)
 
-        # Load the font
-        font = ImageFont.truetype(font_path, self.settings.title_font_size)
-
-        # Wrap the text to fit within the maximum width
-        wrapped_text = self._wrap_text(title_text, font, self.settings.title_max_width)
+        title_text = self._get_element_text(element, data)
+        font_size = self._get_title_font_size(element, title_text)
+        font, layout = self._layout_title(element, title_text, font_size)
 
         # Calculate the bounding box for the multiline text
-        bbox = draw.multiline_textbbox((0, 0), wrapped_text, font=font, spacing=self.settings.title_line_spacing)
+        bbox = layout.get_bbox()
 
         # Calculate the width and height of the text
         text_width = bbox[2] - bbox[0]
         text_height = bbox[3] - bbox[1]
 
         # Determine the starting position for center alignment
-        start_y = self.settings.title_margin_from_top
+        start_y = element.margin_from_top
         start_x = (self.width - text_width) // 2
 
-        # Set the title text color
-        if self.settings.overlay_bg:
-            # If overlay background is enabled, determine title text color based on image brightness
-            # If the image is light, use the dark title text color; otherwise, use the default title text color
-            title_fill_color = self.settings.title_text_color_dark if contains_light else self.settings.title_text_color_default
-        else:
-            # If overlay background is disabled, use the default title text color
-            title_fill_color = self.settings.title_text_color_default
+        # Use the title color for light backgrounds if the background image is light
+        title_fill_color = element.color_on_light if context['contains_light'] else element.color
 
         # Draw the text onto the canvas
+        draw.text((start_x, start_y), layout.text, font=font, fill=title_fill_color,
+                  spacing=element.line_spacing, align='center')
+
+        context['bottom'] = start_y + text_height
+        self._set_title_font_size(context, font_size)
+
+    def _validate_title(self, element, data, context):
+        problems = []
+        content_bottom = self._get_content_bottom()
+
+        title_text = self._get_element_text(element, data)
+        if not title_text.strip():
+            problems.append(('empty_title', 'The title is empty'))
+
+        # Measure the title the same way _draw_title lays it out
+        if element.auto_fit:
+            font_size, fits = self._fit_title_font_size(element, title_text)
+        else:
+            font_size, fits = element.font_size, True
+        title_width, title_height = self._measure_title(element, title_text, font_size)
+
+        if title_width > element.max_width:
+            problems.append(('title_too_wide', f'The title is {title_width}px wide, '
+                                               f'the maximum is {element.max_width}px'))
+
+        title_bottom = element.margin_from_top + title_height
+        if title_bottom > content_bottom:
+            problems.append(('title_too_tall', f'The title ends at {title_bottom}px, '
+                                               f'the content area ends at {content_bottom}px'))
+        elif not fits:
+            problems.append(('title_too_tall', f'The title is {title_height}px tall at the minimum font size, '
+                                               f'the maximum is {element.max_height}px'))
+
+        context['bottom'] = title_bottom
+        return problems
+
+    @staticmethod
+    def _prepare_tips(text):
+        # Split the text into lines and remove empty lines
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
 
-        draw.text((start_x, start_y), wrapped_text, font=font, fill=title_fill_color,
-                  spacing=self.settings.title_line_spacing, align='center')
+        # Initialize a list to store the items
+        items = []
+
+        for line in lines:
+            # Use regular expression to extract items
+            match = re.match(r'^\d+\.\s(.+?)[.;]*$', line)
+            if match:
+                item = match.group(1)
+                items.append(item)
+
+        return items
+
+    @staticmethod
+    def _layout_tips(element, text_lines, tips_font):
+        tips_engine = get_layout_engine(tips_font)
+        return [tips_engine.layout(line, element.max_text_width, element.line_spacing)
+                for line in text_lines[:element.count]]
 
-        return text_height
+    def _draw_numbered_list(self, element, data, context):
+        rectangle = element.rectangle
+        circle = element.circle
 
-    def _draw_text_with_rectangle(self, text_lines, font_path, title_text_height):
-        # Load fonts for tips text and numbers
-        tips_font = ImageFont.truetype(font_path, self.settings.tips_font_size)
-        number_font = ImageFont.truetype(font_path, self.settings.tips_number_font_size)
+        # Nothing to draw if the row has no items in the "1. Item" format
+        text_lines = self._prepare_tips(data.get(element.column, ''))
+        if not text_lines:
+            return
+
+        # Get fonts for tips text and numbers from the shared font cache
+        tips_font = FONT_CACHE.get(element.font, element.font_size)
+        number_font = FONT_CACHE.get(circle.font, circle.font_size)
 
         # Wrap text lines to fit within the maximum text width
-        text_lines = [self._wrap_text(line, tips_font, self.settings.tips_max_text_width) for line in text_lines]
+        layouts = self._layout_tips(element, text_lines, tips_font)
 
         # Calculate the maximum width of the text block
-        max_text_width = max(
-            tips_font.getbbox(elem)[2] - tips_font.getbbox(elem)[0]
-            for line in text_lines[:self.settings.tips_count]
-            for elem in line.splitlines()
-        )
+        max_text_width = max(layout.max_line_width for layout in layouts)
+
+        # Determine the starting Y position for drawing text, below the previous element
+        start_y = context['bottom'] + element.top_margin
 
-        # Determine the starting Y position for drawing text
-        start_y = self.settings.title_margin_from_top + title_text_height + self.settings.tips_top_margin
+        # Drawing object used only to measure the text
+        measure_draw = ImageDraw.Draw(self.canvas)
 
         # Draw each text line with its respective rectangle and circle
-        for line_number, line in enumerate(text_lines[:self.settings.tips_count], start=1):
-            # Create a transparent canvas
-            transparent_canvas = Image.new('RGBA', self.canvas.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(transparent_canvas)
+        for line_number, layout in enumerate(layouts, start=1):
+            line = layout.text
 
-            # Calculate the bounding box for multiline text using the multiline_textbbox method
-            bbox = draw.multiline_textbbox((0, 0), line, font=tips_font, spacing=self.settings.tips_line_spacing)
+            # Calculate the bounding box for the multiline text from its layout
+            bbox = layout.get_bbox()
 
             # Calculate the width and height of the text by subtracting corresponding coordinates from bbox
             text_width = bbox[2] - bbox[0]
             text_height = bbox[3] - bbox[1]
 
             # Calculate the height of the rectangle by adding top and bottom paddings to the text height
-            rectangle_height = text_height + self.settings.rectangle_top_padding + self.settings.rectangle_bottom_padding
+            rectangle_height = text_height + rectangle.vertical_padding
             # Calculate the width of the rectangle by adding left and right paddings to the maximum text width
-            rectangle_width = max_text_width + 2 * self.settings.rectangle_horizontal_padding
+            rectangle_width = max_text_width + 2 * rectangle.horizontal_padding
 
             # Determine the starting X position for the rectangle,
             # aligning it to the center relative to the image and adding offset
-            start_x_rectangle = (self.width - rectangle_width) // 2 + self.settings.tips_block_x_offset
+            start_x_rectangle = (self.width - rectangle_width) // 2 + element.x_offset
             # Determine the starting X position for the text inside the rectangle,
             # aligning it to the center relative to the image and adding offset
-            start_x_text = (self.width - max_text_width) // 2 + self.settings.tips_block_x_offset
-
-            # Convert the rectangle fill color to RGBA format with transparency
-            rectangle_fill_color = self._color_with_alpha(self.settings.rectangle_fill_color,
-                                                          self.settings.rectangle_opacity)
+            start_x_text = (self.width - max_text_width) // 2 + element.x_offset
 
-            # Draw the rectangle with specified parameters
-            draw.rounded_rectangle((start_x_rectangle,
-                                    start_y - self.settings.rectangle_top_padding,
-                                    start_x_rectangle + rectangle_width,
-                                    start_y + rectangle_height),
-                                   fill=rectangle_fill_color,
-                                   outline=self.settings.rectangle_outline, width=self.settings.rectangle_outline_width,
-                                   radius=self.settings.rectangle_corner_radius)
-
-            # Draw the text inside the rectangle
-            draw.text((start_x_text, start_y), line, font=tips_font, fill=self.settings.tips_text_color,
-                      spacing=self.settings.tips_line_spacing)
+            rectangle_box = (start_x_rectangle,
+                             start_y - rectangle.top_padding,
+                             start_x_rectangle + rectangle_width,
+                             start_y + rectangle_height)
 
             # Determine the coordinates for the circle with the number
-            circle_x = start_x_text + self.settings.circle_x_offset
-            circle_y = start_y + \
-                       (rectangle_height - self.settings.rectangle_top_padding) // 2 + self.settings.circle_y_offset
-
-            # Convert the circle fill color to RGBA format with transparency
-            circle_fill_color = self._color_with_alpha(self.settings.circle_fill_color, self.settings.circle_opacity)
-
-            # Draw the circle
-            draw.ellipse((circle_x - self.settings.circle_radius,
-                          circle_y - self.settings.circle_radius,
-                          circle_x + self.settings.circle_radius,
-                          circle_y + self.settings.circle_radius),
-                         fill=circle_fill_color, outline=self.settings.circle_outline,
-                         width=self.settings.circle_outline_width)
-
-            # Draw the number inside the circle
-            draw.text((circle_x + self.settings.circle_text_x_offset, circle_y + self.settings.circle_text_y_offset),
-                      str(line_number), anchor='mm', font=number_font, fill=self.settings.circle_text_color)
+            circle_x = start_x_text + circle.x_offset
+            circle_y = start_y + (rectangle_height - rectangle.top_padding) // 2 + circle.y_offset
+
+            circle_box = (circle_x - circle.radius,
+                          circle_y - circle.radius,
+                          circle_x + circle.radius,
+                          circle_y + circle.radius)
+
+            number_xy = (circle_x + circle.text_x_offset, circle_y + circle.text_y_offset)
+
+            def draw_item(draw, offset_x, offset_y, rectangle_box=rectangle_box, circle_box=circle_box,
+                          number_xy=number_xy, start_x_text=start_x_text, start_y=start_y, line=line,
+                          line_number=line_number):
+                # Draw the rectangle with specified parameters
+                draw.rounded_rectangle(self._shift_box(rectangle_box, offset_x, offset_y),
+                                       fill=rectangle.fill_color,
+                                       outline=rectangle.outline,
+                                       width=rectangle.outline_width,
+                                       radius=rectangle.corner_radius)
+
+                # Draw the text inside the rectangle
+                draw.text((start_x_text - offset_x, start_y - offset_y), line, font=tips_font,
+                          fill=element.text_color, spacing=element.line_spacing)
+
+                # Draw the circle
+                draw.ellipse(self._shift_box(circle_box, offset_x, offset_y),
+                             fill=circle.fill_color, outline=circle.outline,
+                             width=circle.outline_width)
+
+                # Draw the number inside the circle
+                draw.text((number_xy[0] - offset_x, number_xy[1] - offset_y),
+                          str(line_number), anchor='mm', font=number_font, fill=circle.text_color)
+
+            # Draw on a transparent layer that covers only the rectangle, the circle and the texts
+            self._composite_layer(
+                (id(element), line_number), draw_item,
+                rectangle_box, circle_box,
+                layout.get_bbox((start_x_text, start_y)),
+                measure_draw.textbbox(number_xy, str(line_number), anchor='mm', font=number_font))
 
             # Update the starting Y position for the next text block
-            start_y += text_height + self.settings.margin_between_tips
+            start_y += text_height + element.margin_between_items
 
-            self.canvas.alpha_composite(transparent_canvas)
+        context['bottom'] = start_y
 
-    @staticmethod
-    def _prepare_tips(text):
-        # Split the text into lines and remove empty lines
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
+    def _validate_numbered_list(self, element, data, context):
+        problems = []
+        content_bottom = self._get_content_bottom()
 
-        # Initialize a list to store the items
-        items = []
+        # Every non-empty tips line has to match the "1. Tip text" format
+        tips_text = data.get(element.column, '')
+        tips_lines_count = sum(1 for line in tips_text.split('\n') if line.strip())
+        tips = self._prepare_tips(tips_text)
+        if len(tips) < tips_lines_count:
+            problems.append(('unparsed_tips', f'{tips_lines_count - len(tips)} of {tips_lines_count} tips lines '
+                                              f'do not match the "1. Tip text" format'))
 
-        for line in lines:
-            # Use regular expression to extract items
-            match = re.match(r'^\d+\.\s(.+?)[.;]*$', line)
-            if match:
-                item = match.group(1)
-                items.append(item)
+        if not tips:
+            problems.append(('no_tips', 'No tips to draw'))
+            return problems
 
-        return items
+        if len(tips) > element.count:
+            problems.append(('too_many_tips', f'{len(tips)} tips, only the first {element.count} are drawn'))
 
-    def generate_image(self, data, image_number):
-        title = data.get('title', '').upper()
-        tips = self._prepare_tips(data.get('tips', ''))
+        # Follow the tip rectangles down the canvas as _draw_numbered_list places them
+        tips_font = FONT_CACHE.get(element.font, element.font_size)
+        start_y = context['bottom'] + element.top_margin
+        for tip_number, layout in enumerate(self._layout_tips(element, tips, tips_font), start=1):
+            text_height = layout.get_size()[1]
+            rectangle_bottom = start_y + text_height + element.rectangle.vertical_padding
 
-        title_font_path = os.path.join(self.template_1_fonts_path, 'title_font.ttf')
-        tips_font_path = os.path.join(self.template_1_fonts_path, 'tips_font.ttf')
-        footer_font_path = os.path.join(self.template_1_fonts_path, 'footer_font.ttf')
+            if rectangle_bottom > content_bottom:
+                problems.append(('tips_into_footer', f'Tip {tip_number} ends at {rectangle_bottom}px, '
+                                                     f'the content area ends at {content_bottom}px'))
+                break
 
-        contains_light = self._draw_background()
+            start_y += text_height + element.margin_between_items
 
-        text_height = self._draw_title(title, title_font_path, contains_light)
+        context['bottom'] = start_y
+        return problems
 
-        self._draw_text_with_rectangle(tips, tips_font_path, text_height)
+    def _layout_boxed_title(self, element, title_text, font_size):
+        second_font_plan = element.second_font
 
-        if self.settings.footer:
-            footer_text_path = os.path.join(self.project_path, 'footer_text.txt')
-            footer_text = self._get_footer_text(footer_text_path, self.settings.footer_text)
-            self._add_footer_with_text(footer_text, footer_font_path)
+        font = FONT_CACHE.get(element.font, font_size)
+        font_2 = FONT_CACHE.get(second_font_plan.font, element.get_second_font_size(font_size))
 
-        if self.show:
-            self.canvas.show()
+        # Wrap the text with the title font and split off the lines drawn with the second font
+        _, layout = self._layout_title(element, title_text, font_size)
 
-        if self.save:
-            file_path = self._get_file_path(image_number)
-            self.save_image(file_path, image_number)
+        if len(layout.lines) >= second_font_plan.lines:
+            first_layout = layout.slice(None, -second_font_plan.lines)
+            second_layout = get_layout_engine(font_2).layout_lines(
+                layout.lines[-second_font_plan.lines:], second_font_plan.line_spacing)
+        else:
+            first_layout = layout
+            second_layout = get_layout_engine(font_2).layout_lines([], second_font_plan.line_spacing)
 
-            if self.write_uploading_data:
-                uploading_data = self._get_uploading_data(data, file_path)
-                self.write_csv(uploading_data, self.UPLOADING_DATA_FILE)
+        return font, font_2, layout, first_layout, second_layout
 
+    def _measure_boxed_title(self, element, title_text, font_size):
+        _, _, layout, first_layout, second_layout = self._layout_boxed_title(element, title_text, font_size)
 
-class Template2ImageGenerator(BaseImageGenerator):
-    def __init__(self, project_folder, width=1000, height=1500, image_format='png', dpi=(72, 72),
-                 save=True, show=True, write_uploading_data=False):
-        template = self.GENERATOR_MODE_2
-        super().__init__(project_folder, template, width, height, image_format, dpi, save, show, write_uploading_data)
+        if not element.second_font.enabled:
+            return layout.get_size()
 
-    def _draw_title(self, title_text, font_path, font_2_path):
-        # Create a transparent canvas
-        transparent_canvas = Image.new('RGBA', self.canvas.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(transparent_canvas)
+        # The lines of the second font are measured with their own font and may be wider
+        first_width, first_height = first_layout.get_size()
+        second_width, second_height = second_layout.get_size()
+        return (max(layout.get_size()[0], second_width),
+                first_height + element.second_font.top_padding + second_height)
 
-        # Load fonts
-        font = ImageFont.truetype(font_path, self.settings.title_font_size)
-        font_2 = ImageFont.truetype(font_2_path, self.settings.another_text_font_size)
+    def _draw_boxed_title(self, element, data, context):
+        second_font_plan = element.second_font
+        rectangle = element.rectangle
 
         # Get image dimensions
         image_width, image_height = self.canvas.size
 
         # Wrap the text and calculate the bounding box for the multiline text
-        wrapped_text = self._wrap_text(title_text, font, self.settings.title_max_width).title()
-        bbox = draw.multiline_textbbox((0, 0), wrapped_text, font=font, spacing=self.settings.title_line_spacing)
+        title_text = self._get_element_text(element, data)
+        font_size = self._get_title_font_size(element, title_text)
+        font, font_2, layout, first_layout, second_layout = self._layout_boxed_title(element, title_text, font_size)
+        bbox = layout.get_bbox()
 
         # Calculate the width and total height of the text
         total_text_width = bbox[2] - bbox[0]
         total_text_height = bbox[3] - bbox[1]
 
-        # Split text into lines for formatting
-        lines = wrapped_text.split('\n')
-
-        # Divide text into sections
-        if len(lines) >= self.settings.strings_with_another_font:
-            first_text = '\n'.join(lines[:-self.settings.strings_with_another_font])
-            second_text = '\n'.join(lines[-self.settings.strings_with_another_font:])
-        else:
-            first_text = wrapped_text
-            second_text = ""
+        first_text = first_layout.text
+        second_text = second_layout.text
 
         # Calculate bounding boxes and heights for the first and second texts
-        first_text_bbox = draw.multiline_textbbox((0, 0), first_text, font=font,
-                                                  spacing=self.settings.title_line_spacing)
+        first_text_bbox = first_layout.get_bbox()
         first_text_height = first_text_bbox[3] - first_text_bbox[1]
         first_text_width = first_text_bbox[2] - first_text_bbox[0]
 
-        second_text_bbox = draw.multiline_textbbox((0, 0), second_text, font=font_2,
-                                                   spacing=self.settings.another_text_line_spacing)
+        second_text_bbox = second_layout.get_bbox()
         second_text_height = second_text_bbox[3] - second_text_bbox[1]
         second_text_width = second_text_bbox[2] - second_text_bbox[0]
 
-        # Adjust total text height if another font is True
-        if self.settings.another_font:
+        # Adjust total text height if the second font is enabled
+        if second_font_plan.enabled:
             total_text_height = first_text_height + second_text_height
 
         # Calculate starting positions for text and rectangle
-        start_y = (image_height - total_text_height) // 2 + self.settings.title_y_offset
+        start_y = (image_height - total_text_height) // 2 + element.y_offset
         start_x = (image_width - total_text_width) // 2
 
         # Adjust rectangle height based on text and padding
-        if self.settings.another_font:
-            rectangle_height = total_text_height + self.settings.rectangle_top_padding + \
-                               self.settings.rectangle_bottom_padding + self.settings.another_text_top_padding
-        else:
-            rectangle_height = total_text_height + self.settings.rectangle_top_padding + \
-                               self.settings.rectangle_bottom_padding
-        rectangle_width = total_text_width + 2 * self.settings.rectangle_horizontal_padding
+        rectangle_height = total_text_height + rectangle.vertical_padding
+        if second_font_plan.enabled:
+            rectangle_height += second_font_plan.top_padding
+        rectangle_width = total_text_width + 2 * rectangle.horizontal_padding
 
         # Calculate coordinates for the rectangle
-        rectangle_x = start_x - self.settings.rectangle_horizontal_padding
-        rectangle_y = start_y - self.settings.rectangle_top_padding
-
-        # Convert rectangle fill color to RGBA format with transparency
-        rectangle_fill_color = self._color_with_alpha(self.settings.rectangle_fill_color,
-                                                      self.settings.rectangle_opacity)
+        rectangle_x = start_x - rectangle.horizontal_padding
+        rectangle_y = start_y - rectangle.top_padding
 
-        # Draw the rectangle under the text
-        draw.rounded_rectangle(
-            (rectangle_x, rectangle_y, rectangle_x + rectangle_width, rectangle_y + rectangle_height),
-            fill=rectangle_fill_color, outline=self.settings.rectangle_outline,
-            width=self.settings.rectangle_outline_width, radius=self.settings.rectangle_corner_radius)
+        rectangle_box = (rectangle_x, rectangle_y, rectangle_x + rectangle_width, rectangle_y + rectangle_height)
 
-        if self.settings.another_font:
+        if second_font_plan.enabled:
             start_x = (image_width - first_text_width) // 2
 
-        # Draw the first text
-        draw.text((start_x, start_y), wrapped_text if not self.settings.another_font else first_text, font=font,
-                  fill=self.settings.title_text_color, align='center', spacing=self.settings.title_line_spacing)
+        # Determine the position of the first text and the second text
+        first_xy = (start_x, start_y)
+        if not second_font_plan.enabled:
+            first_layout = layout
+            first_text = layout.text
+        text_boxes = [first_layout.get_bbox(first_xy, align='center')]
 
-        # Draw the second text if another font is True
-        if self.settings.another_font:
-            start_y += first_text_height + self.settings.another_text_top_padding
+        if second_font_plan.enabled:
+            start_y += first_text_height + second_font_plan.top_padding
             start_x = (image_width - second_text_width) // 2
+            second_xy = (start_x, start_y)
+            text_boxes.append(second_layout.get_bbox(second_xy, align='center'))
+
+        context['bottom'] = rectangle_box[3]
+        self._set_title_font_size(context, font_size)
+
+        def draw_title(draw, offset_x, offset_y):
+            # Draw the rectangle under the text
+            draw.rounded_rectangle(
+                self._shift_box(rectangle_box, offset_x, offset_y),
+                fill=rectangle.fill_color, outline=rectangle.outline,
+                width=rectangle.outline_width, radius=rectangle.corner_radius)
+
+            # Draw the first text
+            draw.text((first_xy[0] - offset_x, first_xy[1] - offset_y), first_text, font=font,
+                      fill=element.color, align='center', spacing=element.line_spacing)
+
+            # Draw the second text if the second font is enabled
+            if second_font_plan.enabled:
+                draw.text((second_xy[0] - offset_x, second_xy[1] - offset_y), second_text, font=font_2,
+                          fill=second_font_plan.color, align='center', spacing=second_font_plan.line_spacing)
+
+        # Draw on a transparent layer that covers only the rectangle and the texts
+        self._composite_layer(id(element), draw_title, rectangle_box, *text_boxes)
+
+    def _validate_boxed_title(self, element, data, context):
+        problems = []
+        content_bottom = self._get_content_bottom()
+        second_font_plan = element.second_font
+        rectangle = element.rectangle
+
+        title_text = self._get_element_text(element, data)
+        if not title_text.strip():
+            problems.append(('empty_title', 'The title is empty'))
+            return problems
+
+        if element.auto_fit:
+            font_size, fits = self._fit_title_font_size(element, title_text)
+        else:
+            font_size, fits = element.font_size, True
+
+        # Place the title rectangle the same way _draw_boxed_title does
+        _, _, layout, first_layout, second_layout = self._layout_boxed_title(element, title_text, font_size)
+        text_width, text_height = layout.get_size()
+        second_text_width = 0
+        if second_font_plan.enabled:
+            second_text_width = second_layout.get_size()[0]
+            text_height = first_layout.get_size()[1] + second_layout.get_size()[1]
+
+        rectangle_height = text_height + rectangle.vertical_padding
+        if second_font_plan.enabled:
+            rectangle_height += second_font_plan.top_padding
+
+        rectangle_top = (self.height - text_height) // 2 + element.y_offset - rectangle.top_padding
+        rectangle_bottom = rectangle_top + rectangle_height
+
+        block_width = max(text_width + 2 * rectangle.horizontal_padding, second_text_width)
+        if block_width > self.width:
+            problems.append(('title_too_wide', f'The title block is {block_width}px wide, '
+                                               f'the canvas is {self.width}px'))
+
+        if rectangle_top < 0 or rectangle_bottom > content_bottom:
+            problems.append(('title_too_tall', f'The title block spans {rectangle_top}px to {rectangle_bottom}px, '
+                                               f'the content area is 0px to {content_bottom}px'))
+        elif not fits:
+            problems.append(('title_too_tall', f'The title does not fit the title box at the minimum font size '
+                                               f'{font_size}'))
+
+        context['bottom'] = rectangle_bottom
+        return problems
+
+    @staticmethod
+    def _set_title_font_size(context, font_size):
+        # The render result reports the font size of the first title of the template
+        if context['title_font_size'] is None:
+            context['title_font_size'] = font_size
+
+    def _validate_row(self, data):
+        problems = []
+        context = {'bottom': 0}
+        for element in self.plan.elements:
+            problems.extend(getattr(self, f'_validate_{element.TYPE}')(element, data, context))
+        return problems
+
+    def _get_cached_title_font_size(self, data):
+        # Font size of the first title, found from the layout alone for an image reused from the cache
+        for element in self.plan.elements:
+            if isinstance(element, (TitlePlan, BoxedTitlePlan)):
+                return self._get_title_font_size(element, self._get_element_text(element, data))
+        return None
+
+    def _render_variant_group(self, data, image_number, background_choice, write_uploading_data, group):
+        # The positions of the elements depend on the canvas size, so every aspect ratio is laid out and drawn
+        # again. The work that does not depend on the size is shared: the word widths are cached per font, the
+        # decoded backgrounds and the gradient and footer layers per size, and the element layers that only moved
+        # are reused from the group drawn before. The title of template 1 is drawn straight on the background,
+        # so it is rasterized again for every aspect ratio.
+        if group[0] is not None:
+            # Lay out the elements again for the aspect ratio of the group, at the size of its largest variant
+            self.width, self.height = group[0].width, group[0].height
+            self.canvas = Image.new('RGBA', (self.width, self.height))
+
+        cache_paths = [None] * len(group)
+        if self.save and self.render_cache_path is not None:
+            cache_paths = [self._get_render_cache_path(data, background_choice, variant) for variant in group]
+
+            if all(os.path.exists(cache_path) for cache_path in cache_paths):
+                title_font_size = self._get_cached_title_font_size(data)
+                return [self._finish_image(data, RenderResult(image_number, title_font_size=title_font_size,
+                                                              cached=True, variant=variant and variant.name),
+                                           write_uploading_data, cache_path)
+                        for variant, cache_path in zip(group, cache_paths)]
+
+            # A cached image must depend only on its key, so nothing is left over from the previous image
+            self.canvas = Image.new('RGBA', (self.width, self.height))
+
+        # State shared by the elements of the image
+        context = {'contains_light': self._draw_background(background_choice), 'bottom': 0, 'title_font_size': None}
+
+        for element in self.plan.elements:
+            getattr(self, f'_draw_{element.TYPE}')(element, data, context)
+
+        if self.plan.footer.enabled:
+            self._add_footer_with_text(self.footer_text, self.plan.footer.font)
+
+        results = []
+        for variant, cache_path in zip(group, cache_paths):
+            image = None
+            if variant is not None and (variant.width, variant.height) != self.canvas.size:
+                # The smaller variants of the group are resampled from the drawn canvas
+                image = self.canvas.resize((variant.width, variant.height), Image.LANCZOS)
+
+            result = RenderResult(image_number, title_font_size=context['title_font_size'],
+                                  variant=variant and variant.name)
+            results.append(self._finish_image(data, result, write_uploading_data, cache_path, image))
+
+        return results
+
+    def generate_image(self, data, image_number, write_uploading_data=None):
+        # The random choices are made once, so all variants of the row show the same design
+        background_choice = self._choose_background(self._get_row_random(data))
+
+        width, height = self.width, self.height
+        try:
+            results = []
+            for group in self._variant_groups:
+                results.extend(self._render_variant_group(data, image_number, background_choice,
+                                                          write_uploading_data, group))
+        finally:
+            # The layout and validation of the generator keep the configured size
+            self.width, self.height = width, height
+            self._row_layers.clear()
+
+        result = results[0]
+        result.variants = results[1:]
+        return result
+
 
-            draw.text((start_x, start_y), second_text, font=font_2,
-                      fill=self.settings.another_text_color, align='center',
-                      spacing=self.settings.another_text_line_spacing)
+class Template1ImageGenerator(TemplateImageGenerator):
+    def __init__(self, project_folder, width=1000, height=1500, image_format='png', dpi=(72, 72),
+                 save=True, show=True, write_uploading_data=False, spec=None, **kwargs):
+        # Template 1 is described by the spec built from Template1Settings, unless another spec is given
+        if spec is None:
+            spec = template_1_spec(Template1Settings())
+        super().__init__(project_folder, spec, width, height, image_format, dpi, save, show, write_uploading_data,
+                         **kwargs)
 
-        self.canvas.alpha_composite(transparent_canvas)
 
-    def generate_image(self, data, image_number):
-        title = data.get('title', '')
+class Template2ImageGenerator(TemplateImageGenerator):
+    def __init__(self, project_folder, width=1000, height=1500, image_format='png', dpi=(72, 72),
+                 save=True, show=True, write_uploading_data=False, spec=None, **kwargs):
+        # Template 2 is described by the spec built from Template2Settings, unless another spec is given
+        if spec is None:
+            spec = template_2_spec(Template2Settings())
+        super().__init__(project_folder, spec, width, height, image_format, dpi, save, show, write_uploading_data,
+                         **kwargs)
 
-        title_font_path = os.path.join(self.template_2_fonts_path, 'title_font.ttf')
-        title_2_font_path = os.path.join(self.template_2_fonts_path, 'title_2_font.ttf')
-        footer_font_path = os.path.join(self.template_2_fonts_path, 'footer_font.ttf')
 
-        self._draw_background()
+# Generator of the current batch worker process
+_batch_generator = None
 
-        self._draw_title(title, title_font_path, title_2_font_path)
 
-        if self.settings.footer:
-            footer_text_path = os.path.join(self.project_path, 'footer_text.txt')
-            footer_text = self._get_footer_text(footer_text_path, self.settings.footer_text)
-            self._add_footer_with_text(footer_text, footer_font_path)
+def _init_batch_worker(generator_class, project_folder, init_params, spec, run_id):
+    global _batch_generator
 
-        if self.show:
-            self.canvas.show()
+    # Create the generator once per worker with the template spec of the parent generator.
+    # The worker is already a separate process, so it encodes its images itself before returning them.
+    _batch_generator = generator_class(project_folder, spec=spec, save=True, show=False, write_uploading_data=False,
+                                       writer_queue_size=0, **init_params)
+    _batch_generator.run_id = run_id
+    _batch_generator._warm_up()
 
-        if self.save:
-            file_path = self._get_file_path(image_number)
-            self.save_image(file_path, image_number)
 
-            if self.write_uploading_data:
-                uploading_data = self._get_uploading_data(data, file_path)
-                self.write_csv(uploading_data, self.UPLOADING_DATA_FILE)
+def _render_batch_worker_row(task):
+    return _batch_generator._render_batch_row(task)
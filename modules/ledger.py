@@ -0,0 +1,97 @@
+import csv
+import os
+
+from modules.base import Pinterest
+
+
+class UploadLedger(Pinterest):
+    def __init__(self, project_folder):
+        super().__init__(project_folder)
+        self.ledger_file_path = os.path.join(self.project_path, self.UPLOAD_LEDGER_FILE)
+
+        # File paths of the Pins uploaded since the last compaction
+        self.uploaded = self._load()
+
+        self._file = None
+
+    def __contains__(self, file_path):
+        return file_path in self.uploaded
+
+    def __len__(self):
+        return len(self.uploaded)
+
+    def _load(self):
+        if not os.path.exists(self.ledger_file_path):
+            return set()
+
+        with open(self.ledger_file_path, 'r', encoding='utf-8') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+
+    def append(self, file_path):
+        # Keep the ledger open in append mode for the whole session
+        if self._file is None:
+            self._file = open(self.ledger_file_path, 'a', encoding='utf-8')
+
+        # Write the line and make it durable before the Pin is considered done
+        self._file.write(f'{file_path}\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self.uploaded.add(file_path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _get_moved_file_paths(self):
+        # File paths of the ledger that are already in uploaded.csv, only these are kept in memory
+        if not os.path.exists(self._get_data_file_path(self.UPLOADED_FILE)):
+            return set()
+        return {row.get('file_path') for row in self.iter_csv(self.UPLOADED_FILE)
+                if row.get('file_path') in self.uploaded}
+
+    def compact(self):
+        self.close()
+
+        # Nothing to move if no Pins were uploaded since the last compaction
+        if not self.uploaded:
+            return 0
+
+        input_file = self._get_data_file_path(self.UPLOADING_DATA_FILE)
+        temp_file = f'{input_file}.tmp'
+
+        moved = 0
+        if os.path.exists(input_file):
+            header = self.CSV_HEADERS[self.UPLOADING_DATA_FILE]
+
+            # Rows already moved by a compaction that crashed before replacing the input file are not moved again
+            already_moved = self._get_moved_file_paths()
+
+            with self.open_appender(self.UPLOADED_FILE, fsync=True) as uploaded, \
+                    open(temp_file, 'w', encoding='utf-8', newline='') as f:
+                writer = csv.writer(f, delimiter=';')
+                writer.writerow(header)
+
+                # Move the uploaded rows to uploaded.csv and keep the remaining rows
+                for row in self.iter_csv(self.UPLOADING_DATA_FILE):
+                    if row.get('file_path') in self.uploaded:
+                        if row.get('file_path') not in already_moved:
+                            uploaded.write(row)
+                        moved += 1
+                    else:
+                        writer.writerow([row.get(column, '') for column in header])
+
+                f.flush()
+                os.fsync(f.fileno())
+
+            # Atomically replace the input file with the compacted one
+            os.replace(temp_file, input_file)
+
+        # Start a new, empty ledger
+        with open(self.ledger_file_path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self.uploaded.clear()
+
+        return moved
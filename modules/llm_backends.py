@@ -0,0 +1,115 @@
+import asyncio
+import random
+import time
+from threading import Lock
+
+
+class BackendError(Exception):
+    # A prompt that the backend could not complete
+    pass
+
+
+class LLMBackend:
+    # Interface of the text generation backends used by the Writer
+    name = 'backend'
+
+    def complete(self, prompt):
+        # Return the answer of the model to the prompt
+        raise NotImplementedError("Subclasses must implement the complete method")
+
+    async def complete_async(self, prompt):
+        # Backends without a native async client run the blocking call in a thread
+        return await asyncio.to_thread(self.complete, prompt)
+
+
+class G4FBackend(LLMBackend):
+    def __init__(self, model='gpt_35_turbo'):
+        # g4f is imported only when this backend is used, the stub backend works without it
+        import g4f
+
+        self._g4f = g4f
+        self.model = getattr(g4f.models, model)
+        self.name = getattr(self.model, 'name', model)
+
+    def _get_messages(self, prompt):
+        # The prompt is set as a user message in the 'messages' parameter
+        return [{'role': 'user', 'content': prompt}]
+
+    def complete(self, prompt):
+        # Create a ChatCompletion instance from g4f module to generate content based on the provided prompt.
+        # The providers of g4f raise many error types, they are reported as BackendError so they can be retried.
+        try:
+            return self._g4f.ChatCompletion.create(model=self.model, messages=self._get_messages(prompt))
+        except Exception as e:
+            raise BackendError(f'{self.name}: {e}') from e
+
+    async def complete_async(self, prompt):
+        try:
+            return await self._g4f.ChatCompletion.create_async(model=self.model,
+                                                               messages=self._get_messages(prompt))
+        except Exception as e:
+            raise BackendError(f'{self.name}: {e}') from e
+
+
+class StubBackend(LLMBackend):
+    # Local backend for tests and benchmarks, it answers with a template after an artificial delay
+    def __init__(self, response='Answer to: {prompt}', latency=0.0, jitter=0.0, failure_rate=0.0, seed=None,
+                 name='stub'):
+        self.response = response  # Formatted with the prompt and the number of the call
+        self.latency = latency  # Seconds every call takes
+        self.jitter = jitter  # Extra seconds added at random to every call, from 0 to jitter
+        self.failure_rate = failure_rate  # Share of the calls that raise BackendError
+        self.name = name
+
+        self.calls = 0
+        self.failures = 0
+
+        # The random numbers come from one seeded generator, so a run can be repeated
+        self._random = random.Random(seed)
+        self._lock = Lock()
+
+    def _next_call(self):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+            return self.calls, delay, failed
+
+    def _answer(self, prompt, number, failed):
+        if failed:
+            raise BackendError(f'Stub failure of call {number}')
+        return self.response.format(prompt=prompt, number=number)
+
+    def complete(self, prompt):
+        number, delay, failed = self._next_call()
+        time.sleep(delay)
+        return self._answer(prompt, number, failed)
+
+    async def complete_async(self, prompt):
+        number, delay, failed = self._next_call()
+        await asyncio.sleep(delay)
+        return self._answer(prompt, number, failed)
+
+
+# Backend class of every backend name that can be used in the config
+BACKENDS = {
+    'g4f': G4FBackend,
+    'stub': StubBackend,
+}
+
+
+def create_backend(config):
+    # The config is a backend, a backend name, or a dictionary with the name under 'backend' and its parameters
+    if isinstance(config, LLMBackend):
+        return config
+    if isinstance(config, str):
+        config = {'backend': config}
+
+    params = dict(config)
+    backend_name = params.pop('backend', 'g4f')
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Invalid backend: {backend_name}. Available backends: {', '.join(BACKENDS)}.")
+
+    return BACKENDS[backend_name](**params)
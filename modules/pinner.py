@@ -1,4 +1,3 @@
-import csv
 import json
 import mimetypes
 import os
@@ -9,6 +8,8 @@ from datetime import datetime
 from time import sleep
 
 from modules.base import Pinterest
+from modules.ledger import UploadLedger
+from modules.records import BoardData, UploadingData
 from py3pin.Pinterest import Pinterest as Py3Pin
 import undetected_chromedriver as uc
 from selenium.webdriver import ActionChains, Keys
@@ -40,6 +41,10 @@ class PinnerBase(Pinterest):
 
         os.makedirs(self.cookies_path, exist_ok=True)
 
+        self.ledger = UploadLedger(project_folder)
+        # Optional SQLite project store that replaces the ledger and the CSV files
+        self.store = None
+
     @staticmethod
     def _cookies_exist(cookies_file_path):
         return os.path.isfile(cookies_file_path)
@@ -160,49 +165,31 @@ class PinnerBase(Pinterest):
         else:
             return input_string
 
-    def _after_success_pin(self, file_path):
-        # Form paths to the input and output files
-        input_file = os.path.join(self.project_path, self.UPLOADING_DATA_FILE)
-        output_file = os.path.join(self.project_path, self.UPLOADED_FILE)
-
-        # Find the row and write it to the uploaded_data.csv file, get the list of remaining rows
-        rows_to_save = self._process_csv(file_path, input_file, output_file)
+    def _pending_upload_data(self, uploading_data):
+        # Skip the rows that were already uploaded but not yet compacted
+        return [row for row in uploading_data if row.get('file_path') not in self.ledger]
 
-        # Update the uploading_data.csv file by writing the remaining rows to it
-        self._save_csv(rows_to_save, input_file)
-        self._log_message('The uploaded Pin data has been moved to the uploaded.csv file.')
+    def _after_success_pin(self, file_path):
+        if self.store:
+            # Move the row from the queue to the uploaded history in one transaction
+            self.store.mark_uploaded(file_path)
+            self._log_message('The uploaded Pin has been marked as uploaded in the project store.')
+        else:
+            # Record the uploaded Pin in the append-only ledger
+            self.ledger.append(file_path)
+            self._log_message('The uploaded Pin has been recorded in the upload ledger.')
 
         # Move the uploaded file to the pinned folder
         self._move_uploaded_file(file_path)
 
-    def _process_csv(self, file_path, input_file, output_file):
-        rows_to_save = []
-
-        delimiter = self._check_csv_delimiter(input_file)
-
-        with open(input_file, 'r', newline="") as file:
-            reader = csv.reader(file, delimiter=delimiter)
-            headers = next(reader)
-            rows_to_save.append(headers)
-
-            for row in reader:
-                if row[4] == file_path:
-                    with open(output_file, 'a', newline='') as out_file:
-                        writer = csv.writer(out_file, delimiter=';')
-                        writer.writerow(row)
+    def compact_uploaded_data(self):
+        # The project store keeps its state up to date and does not need a compaction
+        if self.store:
+            return
 
-                    # or
-                    # self.write_csv(row, self.UPLOADED_FILE)
-                else:
-                    rows_to_save.append(row)
-
-        return rows_to_save
-
-    @staticmethod
-    def _save_csv(rows_to_save, input_file):
-        with open(input_file, 'w', newline='') as file:
-            writer = csv.writer(file, delimiter=';')
-            writer.writerows(rows_to_save)
+        # Move the rows recorded in the ledger from uploading_data.csv to uploaded.csv
+        moved = self.ledger.compact()
+        self._log_message(f'{moved} uploaded Pins have been moved to the {self.UPLOADED_FILE} file.')
 
     def _move_uploaded_file(self, file_path):
         destination_file_path = os.path.join(self.pinned_path, os.path.basename(file_path))
@@ -518,6 +505,9 @@ class RequestsPinner(PinnerBase, Py3Pin):
         return False
 
     def upload(self, uploading_data, pins=10, shuffle=False, timeout=(3, 8), emoji=True, move_data_after_upload=True):
+        # Skip the rows that are already recorded in the upload ledger
+        uploading_data = self._pending_upload_data(uploading_data)
+
         # If shuffle is True, shuffle the uploading_data list
         if shuffle:
             random.shuffle(uploading_data)
@@ -592,6 +582,10 @@ class RequestsPinner(PinnerBase, Py3Pin):
                 delay_min, delay_max = timeout
                 self._random_delay(delay_min, delay_max)
 
+        # Compact the data files once at the end of the session
+        if move_data_after_upload:
+            self.compact_uploaded_data()
+
     def create_boards(self, boards_data, timeout=(3, 8)):
         # Obtain the list of existing boards and their names
         existing_boards = self.boards_all(username=self.username)
@@ -795,6 +789,8 @@ class SeleniumPinner(PinnerBase):
         sleep(10)
 
     def upload(self, uploading_data, pins=10, shuffle=False, timeout=(3, 8), move_data_after_upload=True):
+        uploading_data = self._pending_upload_data(uploading_data)
+
         if shuffle:
             random.shuffle(uploading_data)
 
@@ -818,97 +814,5 @@ class SeleniumPinner(PinnerBase):
 
         self.driver.close()
 
-
-class BoardData:
-    def __init__(self, board_name='', board_description=''):
-        self.board_name = self._truncate_text(board_name, 50)
-        self.board_description = self._truncate_text(board_description, 495)
-
-    @staticmethod
-    def _truncate_text(text, max_length):
-        if len(text) <= max_length:
-            return text
-        else:
-            return text[:max_length]
-
-
-class UploadingData:
-    def __init__(self, file_path='', board_name='', hashtag='', pin_title='', pin_description='',
-                 pin_link='', mode='', keyword=''):
-        self.file_path = file_path
-        self.board_name = board_name
-        self._hashtag = self._prepare_hashtags(hashtag)
-        self.pin_title = self._truncate_text(pin_title, 95)
-        self.pin_description = self._prepare_description(pin_description, self._hashtag, 495, 400)
-        self.pin_link = pin_link
-        self.mode = mode
-        self.keyword = keyword
-
-    @staticmethod
-    def _truncate_text(text, max_length):
-        if len(text) <= max_length:
-            return text
-        else:
-            return text[:max_length]
-
-    @staticmethod
-    def _prepare_hashtags(input_string):
-        if not input_string:
-            return ""
-
-        if ',' in input_string:
-            hashtags = input_string.split(',')
-        else:
-            hashtags = input_string.split()
-
-        hashtags = [tag.strip().capitalize() for tag in hashtags]
-        hashtags = ['#' + tag if not tag.startswith('#') else tag for tag in hashtags]
-        result_string = ' '.join(hashtags)
-
-        first_hashtag = '#' + ''.join(word.capitalize() for word in input_string.split())
-
-        return f'{first_hashtag} {result_string}'
-
-    @staticmethod
-    def _prepare_description(description, hashtags, max_length, min_length_description):
-        if len(description) + len(hashtags) <= max_length:
-            return f'{description} {hashtags}'
-
-        if len(description) > min_length_description:
-            new_description = description[:min_length_description]
-        else:
-            remaining_space = max_length - len(hashtags)
-            new_description = description[:remaining_space]
-
-        if len(new_description) + len(hashtags) <= max_length:
-            return f'{new_description} {hashtags}'
-        else:
-            remaining_space = max_length - len(new_description)
-            new_hashtags = hashtags[:remaining_space]
-            return f'{new_description} {new_hashtags}'
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        if move_data_after_upload:
+            self.compact_uploaded_data()
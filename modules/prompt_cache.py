@@ -0,0 +1,119 @@
+import hashlib
+import sqlite3
+from threading import Lock
+from time import time
+
+
+class PromptCache:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            response TEXT,
+            size INTEGER,
+            created_at REAL,
+            accessed_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+    '''
+
+    def __init__(self, db_path, ttl=30 * 24 * 3600, max_bytes=64 * 1024 * 1024, bypass=False):
+        self.db_path = db_path
+        self.ttl = ttl  # Seconds an answer is reused, None keeps the answers until they are evicted
+        self.max_bytes = max_bytes  # Total size of the stored answers, the least recently used are evicted
+        self.bypass = bypass  # Ask the model again for every prompt and replace the stored answers
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+        # The writer threads share one connection, the lock serializes its use
+        self._lock = Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.SCHEMA)
+
+        self._bytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _get_key(model, prompt):
+        # The answer depends only on the model and the prompt with the title already substituted
+        return hashlib.sha256(f'{model}\0{prompt}'.encode('utf-8')).hexdigest()
+
+    def get(self, model, prompt):
+        if self.bypass:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        key = self._get_key(model, prompt)
+        now = time()
+
+        with self._lock:
+            row = self.connection.execute('SELECT response, size, created_at FROM responses WHERE key = ?',
+                                          (key,)).fetchone()
+
+            if row is not None and self.ttl is not None and now - row[2] > self.ttl:
+                # The answer is too old, it is replaced by the next answer of the model
+                self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._bytes -= row[1]
+                self.expired += 1
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, model, prompt, response):
+        key = self._get_key(model, prompt)
+        size = len(response.encode('utf-8'))
+        now = time()
+
+        with self._lock:
+            old = self.connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                                    (key, str(model), response, size, now, now))
+            self._bytes += size - (old[0] if old else 0)
+
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop the least recently used answers until the cache is a tenth below its budget,
+        # so the eviction does not run again on the next answer
+        target = self.max_bytes * 0.9
+        rows = self.connection.execute('SELECT key, size FROM responses ORDER BY accessed_at')
+
+        keys = []
+        for key, size in rows:
+            if self._bytes <= target:
+                break
+            keys.append((key,))
+            self._bytes -= size
+        rows.close()
+
+        self.connection.executemany('DELETE FROM responses WHERE key = ?', keys)
+        self.evicted += len(keys)
+
+    def stats(self):
+        with self._lock:
+            entries = self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'entries': entries,
+                'bytes': self._bytes,
+            }
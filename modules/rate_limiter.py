@@ -0,0 +1,170 @@
+import random
+import time
+from collections import deque
+from threading import Condition, Lock
+
+from modules.llm_backends import BackendError
+
+
+class TokenBucket:
+    # Allows rate requests per minute on average, with bursts of up to burst requests
+    def __init__(self, requests_per_minute, burst=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1, requests_per_minute // 10)
+
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        # Wait until a token is available and take it, return the seconds waited
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+
+                delay = (1 - self._tokens) / self.rate
+
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveConcurrency:
+    # Concurrency limit that grows by one every limit calls while the error rate of the recent calls stays
+    # at or below error_threshold, and is halved when it rises above (additive increase, multiplicative decrease)
+    def __init__(self, max_concurrency, min_concurrency=1, window=20, error_threshold=0.2, decrease_factor=0.5):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.error_threshold = error_threshold
+        self.decrease_factor = decrease_factor
+        self.limit = max_concurrency
+
+        self.active = 0
+        self.decreases = 0
+
+        # Outcomes of the recent calls, True for a failure
+        self._outcomes = deque(maxlen=window)
+        self._since_change = 0
+        self._condition = Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+
+    def release_unused(self):
+        # Give back a slot that was not used for a call, it does not count as an outcome
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def release(self, failed):
+        with self._condition:
+            self.active -= 1
+            self._outcomes.append(failed)
+            self._since_change += 1
+
+            error_rate = sum(self._outcomes) / len(self._outcomes)
+            if failed and error_rate > self.error_threshold:
+                # Decrease at most once per limit calls, the failures of the calls that were
+                # already running with the old limit do not count again
+                if self._since_change >= self.limit and self.limit > self.min_concurrency:
+                    self.limit = max(self.min_concurrency, int(self.limit * self.decrease_factor))
+                    self.decreases += 1
+                    self._since_change = 0
+            elif error_rate <= self.error_threshold and self._since_change >= self.limit \
+                    and self.limit < self.max_concurrency:
+                # Grow only while the errors are low, a success among many failures does not count
+                self.limit += 1
+                self._since_change = 0
+
+            self._condition.notify_all()
+
+
+class RateLimiter:
+    # Shared gate in front of the model calls: a request rate, an adaptive number of concurrent calls,
+    # and retries with exponential backoff and full jitter for the failed calls.
+    # With a HedgedCaller, a call that is slow once it has its token and slot gets a second copy that goes
+    # through the gate as well.
+    def __init__(self, requests_per_minute=60, burst=None, max_concurrency=8, min_concurrency=1, max_retries=4,
+                 base_delay=1.0, max_delay=30.0, retryable_errors=(BackendError, ConnectionError, TimeoutError),
+                 hedger=None):
+        self.bucket = TokenBucket(requests_per_minute, burst) if requests_per_minute else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency, min_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # Errors of the backend or the network, other errors are raised at once
+        self.retryable_errors = retryable_errors
+        self.hedger = hedger
+
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.throttled_seconds = 0.0
+        self._lock = Lock()
+
+    def _get_backoff(self, attempt):
+        # Full jitter spreads the retries of the calls that failed together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, function, *args, name='default'):
+        # The latencies of the calls are measured separately for every name, e.g. the backend name
+        if self.hedger is not None:
+            return self.hedger.call(name, self._call, function, *args)
+        return self._call(None, function, *args)
+
+    def _call(self, copy, function, *args):
+        # copy is the copy of a hedged call, it runs the function and stops the retries when it is cancelled
+        for attempt in range(self.max_retries + 1):
+            waited = self.bucket.acquire() if self.bucket else 0.0
+            self.concurrency.acquire()
+
+            if copy is not None and copy.cancelled.is_set():
+                # The other copy has answered while this one was waiting
+                self.concurrency.release_unused()
+                copy.check()
+
+            failed = True
+            try:
+                result = copy.run(function, *args) if copy is not None else function(*args)
+                failed = False
+                return result
+            except self.retryable_errors:
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+            finally:
+                self.concurrency.release(failed)
+                with self._lock:
+                    self.calls += 1
+                    self.throttled_seconds += waited
+
+            with self._lock:
+                self.retries += 1
+
+            # The backoff ends early when the other copy of a hedged call answers
+            backoff = self._get_backoff(attempt)
+            if copy is None:
+                time.sleep(backoff)
+            elif copy.cancelled.wait(backoff):
+                copy.check()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'retries': self.retries,
+                'failures': self.failures,
+                'throttled_seconds': self.throttled_seconds,
+                'concurrency_limit': self.concurrency.limit,
+                'concurrency_decreases': self.concurrency.decreases,
+            }
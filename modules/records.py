@@ -0,0 +1,166 @@
+class CsvRecord:
+    # Columns of the record, the values are stored in slots instead of a per-row dictionary
+    __slots__ = ()
+
+    def __init__(self, *values):
+        # Assign the values in column order, missing trailing values become empty strings
+        for column, value in zip(self.__slots__, values):
+            setattr(self, column, value)
+        for column in self.__slots__[len(values):]:
+            setattr(self, column, '')
+
+    def get(self, key, default=None):
+        if key in self.__slots__:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def keys(self):
+        return self.__slots__
+
+    def values(self):
+        return [getattr(self, column) for column in self.__slots__]
+
+    def items(self):
+        return [(column, getattr(self, column)) for column in self.__slots__]
+
+    def __eq__(self, other):
+        if isinstance(other, (CsvRecord, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self.items())!r})'
+
+
+class VideoPromptRecord(CsvRecord):
+    __slots__ = ('keyword', 'title_prompt', 'description_prompt')
+
+
+class ImagePromptRecord(CsvRecord):
+    __slots__ = ('keyword', 'title_prompt', 'description_prompt', 'tips_prompt')
+
+
+class GeneratorDataRecord(CsvRecord):
+    __slots__ = ('mode', 'keyword', 'title', 'description', 'tips')
+
+
+class WriterRetryRecord(CsvRecord):
+    __slots__ = ('mode', 'keyword', 'title_prompt', 'description_prompt', 'tips_prompt', 'error')
+
+
+class UploadingDataRecord(CsvRecord):
+    __slots__ = ('mode', 'keyword', 'title', 'description', 'file_path', 'board_name', 'pin_link')
+
+
+class BoardRecord(CsvRecord):
+    __slots__ = ('board_name', 'board_description')
+
+
+class CreatedBoardRecord(CsvRecord):
+    __slots__ = ('board_name', 'board_id')
+
+
+class BoardData:
+    __slots__ = ('board_name', 'board_description')
+
+    def __init__(self, board_name='', board_description=''):
+        self.board_name = self._truncate_text(board_name, 50)
+        self.board_description = self._truncate_text(board_description, 495)
+
+    @staticmethod
+    def _truncate_text(text, max_length):
+        if len(text) <= max_length:
+            return text
+        else:
+            return text[:max_length]
+
+
+class UploadingData:
+    __slots__ = ('file_path', 'board_name', 'pin_title', 'pin_link', 'mode', 'keyword',
+                 '_hashtag_source', '_description_source', '_hashtag', '_pin_description')
+
+    def __init__(self, file_path='', board_name='', hashtag='', pin_title='', pin_description='',
+                 pin_link='', mode='', keyword=''):
+        self.file_path = file_path
+        self.board_name = board_name
+        self.pin_title = self._truncate_text(pin_title, 95)
+        self.pin_link = pin_link
+        self.mode = mode
+        self.keyword = keyword
+
+        # Hashtags and the description are prepared on first access
+        self._hashtag_source = hashtag
+        self._description_source = pin_description
+        self._hashtag = None
+        self._pin_description = None
+
+    @property
+    def hashtag(self):
+        if self._hashtag is None:
+            self._hashtag = self._prepare_hashtags(self._hashtag_source)
+        return self._hashtag
+
+    @property
+    def pin_description(self):
+        if self._pin_description is None:
+            self._pin_description = self._prepare_description(self._description_source, self.hashtag, 495, 400)
+        return self._pin_description
+
+    @staticmethod
+    def _truncate_text(text, max_length):
+        if len(text) <= max_length:
+            return text
+        else:
+            return text[:max_length]
+
+    @staticmethod
+    def _prepare_hashtags(input_string):
+        if not input_string:
+            return ""
+
+        if ',' in input_string:
+            hashtags = input_string.split(',')
+        else:
+            hashtags = input_string.split()
+
+        hashtags = [tag.strip().capitalize() for tag in hashtags]
+        hashtags = ['#' + tag if not tag.startswith('#') else tag for tag in hashtags]
+        result_string = ' '.join(hashtags)
+
+        first_hashtag = '#' + ''.join(word.capitalize() for word in input_string.split())
+
+        return f'{first_hashtag} {result_string}'
+
+    @staticmethod
+    def _prepare_description(description, hashtags, max_length, min_length_description):
+        if len(description) + len(hashtags) <= max_length:
+            return f'{description} {hashtags}'
+
+        if len(description) > min_length_description:
+            new_description = description[:min_length_description]
+        else:
+            remaining_space = max_length - len(hashtags)
+            new_description = description[:remaining_space]
+
+        if len(new_description) + len(hashtags) <= max_length:
+            return f'{new_description} {hashtags}'
+        else:
+            remaining_space = max_length - len(new_description)
+            new_hashtags = hashtags[:remaining_space]
+            return f'{new_description} {new_hashtags}'
@@ -0,0 +1,144 @@
+import csv
+import io
+import mmap
+import os
+import struct
+import zlib
+
+# Layout of the index file header: magic, indexed size of the CSV file, CRC of the heading line
+# and CRC of the bytes right before the indexed size, padded so the offsets stay aligned
+HEADER_FORMAT = '<4sQII4x'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'PMX1'
+
+# Number of bytes before the indexed size that are checked to detect a rewritten file
+TAIL_SIZE = 64
+
+
+class CsvRowIndex:
+    def __init__(self, csv_path, index_path=None):
+        self.csv_path = csv_path
+        self.index_path = index_path or f'{csv_path}.idx'
+
+        self.heading = b''
+        self._mmap = None
+        self._offsets = None
+        self._indexed_size = 0
+
+    def __enter__(self):
+        self.refresh()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._offsets) if self._offsets is not None else 0
+
+    def close(self):
+        if self._offsets is not None:
+            self._offsets.release()
+            self._offsets = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def refresh(self):
+        self.close()
+
+        with open(self.csv_path, 'rb') as csv_file:
+            self.heading = csv_file.readline()
+            csv_size = os.fstat(csv_file.fileno()).st_size
+            heading_crc = zlib.crc32(self.heading)
+
+            header = self._read_header()
+            if header and header[2] == heading_crc and header[1] <= csv_size \
+                    and header[3] == self._tail_crc(csv_file, header[1]):
+                # The file only grew since the last run, index the appended rows
+                if header[1] < csv_size:
+                    self._update(csv_file, header[1], heading_crc, append=True)
+            else:
+                # The file is new or was rewritten, build the index from scratch
+                self._update(csv_file, len(self.heading), heading_crc, append=False)
+
+        self._map()
+        return len(self)
+
+    def _read_header(self):
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) < HEADER_SIZE:
+            return None
+
+        with open(self.index_path, 'rb') as index_file:
+            header = struct.unpack(HEADER_FORMAT, index_file.read(HEADER_SIZE))
+
+        return header if header[0] == MAGIC else None
+
+    @staticmethod
+    def _tail_crc(csv_file, size):
+        start = max(0, size - TAIL_SIZE)
+        csv_file.seek(start)
+        return zlib.crc32(csv_file.read(size - start))
+
+    def _update(self, csv_file, start, heading_crc, append):
+        csv_file.seek(start)
+
+        offsets = []
+        position = start
+        record_start = start
+        quotes = 0
+
+        # Walk over the lines and cut records where the number of quotes is even,
+        # so quoted fields with line breaks stay inside one record
+        for line in csv_file:
+            quotes += line.count(b'"')
+            position += len(line)
+
+            if quotes % 2 == 0 and line.endswith(b'\n'):
+                # Skip empty lines the same way the CSV reader does
+                if position - record_start > len(line) or line.strip():
+                    offsets.append(record_start)
+                record_start = position
+                quotes = 0
+
+        # A record without a trailing line break may still be written, it is indexed on the next refresh
+        indexed_size = record_start
+
+        mode = 'r+b' if append else 'wb'
+        with open(self.index_path, mode) as index_file:
+            # Append the new offsets after the existing ones, or after a room for the header in a new index
+            index_file.seek(0, os.SEEK_END)
+            if not append:
+                index_file.write(bytes(HEADER_SIZE))
+            index_file.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+
+            index_file.seek(0)
+            index_file.write(struct.pack(HEADER_FORMAT, MAGIC, indexed_size, heading_crc,
+                                         self._tail_crc(csv_file, indexed_size)))
+
+        self._indexed_size = indexed_size
+
+    def _map(self):
+        header = self._read_header()
+        self._indexed_size = header[1]
+
+        if os.path.getsize(self.index_path) == HEADER_SIZE:
+            self._offsets = memoryview(b'').cast('Q')
+            return
+
+        with open(self.index_path, 'rb') as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = memoryview(self._mmap)[HEADER_SIZE:].cast('Q')
+
+    def read_rows(self, positions, delimiter):
+        # Read and parse only the records at the given positions
+        rows = []
+        with open(self.csv_path, 'rb') as csv_file:
+            for position in positions:
+                start = self._offsets[position]
+                end = self._offsets[position + 1] if position + 1 < len(self) else self._indexed_size
+
+                csv_file.seek(start)
+                record = csv_file.read(end - start).decode('utf-8')
+                rows.append(next(csv.reader(io.StringIO(record, newline=''), delimiter=delimiter)))
+
+        return rows
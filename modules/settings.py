@@ -9,6 +9,7 @@ class Template1Settings:
     random_colors: Tuple[str] = ('#040038', '#8142f6', '#4395b1')
     overlay_bg: bool = False
     resize_bg: bool = False
+    bg_luminance_analysis: bool = True  # Detect light backgrounds by their pixels, unless the name says "light"/"dark"
 
     title_font_size: int = 75
     title_max_width: int = 900
@@ -17,6 +18,11 @@ class Template1Settings:
     title_line_spacing: int = 15
     title_margin_from_top: int = 50
 
+    title_auto_fit: bool = False  # Pick the largest title font size that fits the title box
+    title_min_font_size: int = 40
+    title_max_font_size: int = 100
+    title_max_height: int = 400
+
     gradient: bool = False
     gradient_direction: int = 360  # 180 - from top to bottom, 360 - from bottom to top
 
@@ -68,6 +74,7 @@ class Template2Settings:
     random_colors: Tuple[str] = ('#7ff3b6', '#e684a5', '#b5abe4', '#26364f')
     overlay_bg: bool = True
     resize_bg: bool = False
+    bg_luminance_analysis: bool = True  # Detect light backgrounds by their pixels, unless the name says "light"/"dark"
 
     gradient: bool = False
     gradient_direction: int = 360  # 180 - from top to bottom, 360 - from bottom to top
@@ -78,6 +85,11 @@ class Template2Settings:
     title_max_width: int = 550
     title_y_offset: int = -100
 
+    title_auto_fit: bool = False  # Pick the largest title font size that fits the title box
+    title_min_font_size: int = 50
+    title_max_font_size: int = 120
+    title_max_height: int = 700
+
     another_font: bool = True
     strings_with_another_font: int = 2
     another_text_top_padding: int = 40
@@ -0,0 +1,342 @@
+import csv
+import io
+import os
+import sqlite3
+import zlib
+from contextlib import contextmanager
+from time import time
+
+from modules.base import Pinterest
+
+
+class ProjectStore(Pinterest):
+    STATUS_QUEUED = 'queued'
+    STATUS_CLAIMED = 'claimed'
+    STATUS_UPLOADED = 'uploaded'
+
+    # Seconds after which a claimed row of a pinner that stopped without uploading it is queued again
+    CLAIM_TIMEOUT = 6 * 3600
+
+    # Number of bytes before the imported size that are checked to detect a rewritten CSV file
+    TAIL_SIZE = 64
+
+    # Table and row filter backing each CSV file
+    TABLES = {
+        Pinterest.UPLOADING_DATA_FILE: ('pins', STATUS_QUEUED),
+        Pinterest.UPLOADED_FILE: ('pins', STATUS_UPLOADED),
+        Pinterest.GENERATOR_DATA_FILE: ('generator_data', None),
+        Pinterest.CREATED_BOARDS_FILE: ('created_boards', None),
+        Pinterest.BOARDS_FILE: ('boards', None),
+    }
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS pins (
+            id INTEGER PRIMARY KEY,
+            mode TEXT, keyword TEXT, title TEXT, description TEXT,
+            file_path TEXT, board_name TEXT, pin_link TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            updated_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS pins_file_path ON pins (file_path);
+        CREATE INDEX IF NOT EXISTS pins_board_name ON pins (board_name);
+        CREATE INDEX IF NOT EXISTS pins_keyword ON pins (keyword);
+        CREATE INDEX IF NOT EXISTS pins_status ON pins (status, id);
+
+        CREATE TABLE IF NOT EXISTS generator_data (
+            id INTEGER PRIMARY KEY,
+            mode TEXT, keyword TEXT, title TEXT, description TEXT, tips TEXT,
+            file_path TEXT, board_name TEXT, pin_link TEXT
+        );
+        CREATE INDEX IF NOT EXISTS generator_data_keyword ON generator_data (keyword);
+
+        CREATE TABLE IF NOT EXISTS created_boards (
+            board_name TEXT PRIMARY KEY,
+            board_id TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS boards (
+            id INTEGER PRIMARY KEY,
+            board_name TEXT, board_description TEXT
+        );
+        CREATE INDEX IF NOT EXISTS boards_board_name ON boards (board_name);
+
+        CREATE TABLE IF NOT EXISTS imports (
+            filename TEXT PRIMARY KEY,
+            imported_size INTEGER,
+            tail_crc INTEGER
+        );
+    '''
+
+    def __init__(self, project_folder):
+        super().__init__(project_folder)
+        self.db_path = os.path.join(self.project_path, self.PROJECT_DB_FILE)
+
+        # True if the database did not exist before
+        self.created = not os.path.exists(self.db_path)
+
+        # Ids of the rows claimed by this store, they are queued again if they are not uploaded
+        self._claimed = set()
+
+        # WAL mode lets several pinner processes read while one of them writes
+        self.connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(self.SCHEMA)
+
+    def close(self):
+        # Give back the claimed rows that were not uploaded, so other pinners can take them
+        if self._claimed:
+            with self._transaction():
+                self.connection.executemany('UPDATE pins SET status = ?, updated_at = ? WHERE id = ? AND status = ?',
+                                            [(self.STATUS_QUEUED, time(), row_id, self.STATUS_CLAIMED)
+                                             for row_id in self._claimed])
+            self._claimed.clear()
+        self.connection.close()
+
+    def _get_table(self, filename):
+        if filename not in self.TABLES:
+            raise ValueError(f"Invalid filename: {filename}. Check the available file names in the base class.")
+        return self.TABLES[filename]
+
+    def _get_columns(self, filename):
+        # Read the CSV layout of the file from the schema registries of the base class
+        return self.CSV_HEADERS.get(filename) or self.CSV_SCHEMAS[filename]
+
+    def iter_csv(self, filename):
+        table, status = self._get_table(filename)
+        columns = self._get_columns(filename)
+
+        query = f'SELECT {", ".join(columns)} FROM {table}'
+        params = ()
+        if status:
+            query += ' WHERE status = ? ORDER BY id'
+            params = (status,)
+
+        cursor = self.connection.execute(query, params)
+        return (dict(zip(columns, row)) for row in cursor)
+
+    def open_csv(self, filename):
+        return list(self.iter_csv(filename))
+
+    def sample_csv(self, filename, count, shuffle=True, exclude=()):
+        table, status = self._get_table(filename)
+        columns = self._get_columns(filename)
+
+        if table == 'pins' and status == self.STATUS_QUEUED:
+            # Queued Pins are claimed, so concurrent pinners never take the same row
+            return self._claim_rows(columns, count, shuffle, exclude)
+
+        query = f'SELECT {", ".join(columns)} FROM {table}'
+        params = []
+        if status:
+            query += ' WHERE status = ?'
+            params.append(status)
+        query += ' ORDER BY RANDOM()' if shuffle else ' ORDER BY id'
+
+        # Let SQLite draw the rows and stop reading as soon as enough of them are collected
+        result = []
+        for row in self.connection.execute(query, params):
+            row_dict = dict(zip(columns, row))
+            if row_dict.get('file_path') not in exclude:
+                result.append(row_dict)
+                if len(result) >= count:
+                    break
+
+        return result
+
+    def _claim_rows(self, columns, count, shuffle, exclude):
+        now = time()
+        result = []
+        claimed_ids = []
+
+        with self._transaction():
+            # Queue the rows again that were claimed by pinners which stopped without uploading them
+            self.connection.execute('UPDATE pins SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?',
+                                    (self.STATUS_QUEUED, now, self.STATUS_CLAIMED, now - self.CLAIM_TIMEOUT))
+
+            order = 'RANDOM()' if shuffle else 'id'
+            cursor = self.connection.execute(
+                f'SELECT id, {", ".join(columns)} FROM pins WHERE status = ? ORDER BY {order}', (self.STATUS_QUEUED,))
+            for row in cursor:
+                row_dict = dict(zip(columns, row[1:]))
+                if row_dict.get('file_path') not in exclude:
+                    result.append(row_dict)
+                    claimed_ids.append(row[0])
+                    if len(result) >= count:
+                        break
+            cursor.close()
+
+            self.connection.executemany('UPDATE pins SET status = ?, updated_at = ? WHERE id = ?',
+                                        [(self.STATUS_CLAIMED, now, row_id) for row_id in claimed_ids])
+
+        self._claimed.update(claimed_ids)
+        return result
+
+    def write_csv(self, data, filename):
+        self.write_rows([data], filename)
+
+    def write_rows(self, rows, filename):
+        # Insert all rows in a single transaction
+        with self._transaction():
+            self._insert_rows(rows, filename)
+
+    def _insert_rows(self, rows, filename):
+        table, status = self._get_table(filename)
+        columns = self._get_columns(filename)
+
+        values = [[row.get(column, '') for column in columns] for row in rows]
+
+        if table == 'pins':
+            columns = columns + ('status', 'updated_at')
+            now = time()
+            values = [value + [status, now] for value in values]
+
+        placeholders = ', '.join('?' for _ in columns)
+        verb = 'INSERT OR REPLACE' if table == 'created_boards' else 'INSERT'
+        self.connection.executemany(f'{verb} INTO {table} ({", ".join(columns)}) VALUES ({placeholders})', values)
+
+    def mark_uploaded(self, file_path):
+        # Move the queued or claimed row to the uploaded state in one transaction
+        with self._transaction():
+            cursor = self.connection.execute(
+                'UPDATE pins SET status = ?, updated_at = ? WHERE file_path = ? AND status IN (?, ?)',
+                (self.STATUS_UPLOADED, time(), file_path, self.STATUS_QUEUED, self.STATUS_CLAIMED))
+        return cursor.rowcount > 0
+
+    def is_uploaded(self, file_path):
+        cursor = self.connection.execute('SELECT 1 FROM pins WHERE file_path = ? AND status = ? LIMIT 1',
+                                         (file_path, self.STATUS_UPLOADED))
+        return cursor.fetchone() is not None
+
+    def get_board_id(self, board_name):
+        cursor = self.connection.execute('SELECT board_id FROM created_boards WHERE board_name = ?', (board_name,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def count(self, filename):
+        table, status = self._get_table(filename)
+        if status:
+            cursor = self.connection.execute(f'SELECT COUNT(*) FROM {table} WHERE status = ?', (status,))
+        else:
+            cursor = self.connection.execute(f'SELECT COUNT(*) FROM {table}')
+        return cursor.fetchone()[0]
+
+    def _read_appended_rows(self, data_file_path, filename, imported_size):
+        columns = self.CSV_SCHEMAS[filename]
+
+        with open(data_file_path, 'rb') as f:
+            heading = f.readline().decode('utf-8')
+            delimiter = self._sniff_delimiter(heading)
+
+            start = imported_size
+            if not start:
+                # A legacy file without a header starts with a row, which has to be imported as well
+                first = next(csv.reader([heading], delimiter=delimiter), [])
+                is_header = tuple(first[:len(columns)]) == tuple(columns[:len(first)])
+                start = f.tell() if is_header else 0
+
+            f.seek(start)
+            data = f.read()
+
+        # A row that is being appended right now is left for the next import. The data is cut after the last
+        # complete line that is outside of a quoted field, so the number of quotes before the cut is even.
+        end = data.rfind(b'\n') + 1
+        while end and data.count(b'"', 0, end) % 2:
+            end = data.rfind(b'\n', 0, end - 1) + 1
+
+        reader = csv.reader(io.StringIO(data[:end].decode('utf-8'), newline=''), delimiter=delimiter)
+        rows = [self.CSV_RECORDS[filename](*row) for row in reader if row]
+
+        # Return the rows with the offset up to which the file has been imported
+        return rows, start + end
+
+    def _tail_crc(self, data_file_path, size):
+        with open(data_file_path, 'rb') as f:
+            f.seek(max(0, size - self.TAIL_SIZE))
+            return zlib.crc32(f.read(min(size, self.TAIL_SIZE)))
+
+    def _is_stored(self, table, columns, row):
+        # True if the table already has a row with the same values
+        conditions = ' AND '.join(f'{column} IS ?' for column in columns)
+        cursor = self.connection.execute(f'SELECT 1 FROM {table} WHERE {conditions} LIMIT 1',
+                                         [row.get(column, '') for column in columns])
+        return cursor.fetchone() is not None
+
+    def import_csv(self, filename):
+        # Copy the rows appended to the CSV file since the last import into the database
+        data_file_path = self._get_data_file_path(filename)
+        if not os.path.exists(data_file_path):
+            return 0
+
+        table, _ = self._get_table(filename)
+        columns = self._get_columns(filename)
+        file_size = os.path.getsize(data_file_path)
+
+        record = self.connection.execute('SELECT imported_size, tail_crc FROM imports WHERE filename = ?',
+                                         (filename,)).fetchone()
+        imported_size = 0
+        check_duplicates = False
+        if record is not None and record[0] <= file_size and record[1] == self._tail_crc(data_file_path, record[0]):
+            # The file only grew since the last import
+            imported_size = record[0]
+        elif record is not None or self.count(filename):
+            # The file was rewritten, or the rows were imported before the import size was recorded.
+            # The whole file is read again and only the rows that are not stored yet are added.
+            check_duplicates = True
+
+        rows, new_size = self._read_appended_rows(data_file_path, filename, imported_size)
+        if check_duplicates:
+            # Pins are identified by their file path, whatever their status is now
+            key_columns = ('file_path',) if table == 'pins' else columns
+            rows = [row for row in rows if not self._is_stored(table, key_columns, row)]
+
+        # The rows and the imported size are saved together, an interrupted import is repeated on the next run
+        with self._transaction():
+            self._insert_rows(rows, filename)
+            self.connection.execute('INSERT OR REPLACE INTO imports VALUES (?, ?, ?)',
+                                    (filename, new_size, self._tail_crc(data_file_path, new_size)))
+
+        if rows:
+            self._log_message(f'{len(rows)} rows have been imported from {filename}.')
+        return len(rows)
+
+    def import_project(self):
+        # Import the rows added to the CSV files since the last run, for example by the Writer or the image generator
+        for filename in self.TABLES:
+            self.import_csv(filename)
+
+    def export_csv(self, filename):
+        data_file_path = self._get_data_file_path(filename)
+        temp_file = f'{data_file_path}.tmp'
+        columns = self._get_columns(filename)
+
+        # Write the rows to a temp file and atomically replace the CSV file with it
+        count = 0
+        with open(temp_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(columns)
+            for row in self.iter_csv(filename):
+                writer.writerow([row.get(column, '') for column in columns])
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, data_file_path)
+
+        self._log_message(f'{count} rows have been exported to {filename}.')
+        return count
+
+    def export_project(self):
+        for filename in self.TABLES:
+            self.export_csv(filename)
+
+    @contextmanager
+    def _transaction(self):
+        # Take the write lock up front so concurrent processes do not interleave their changes
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        else:
+            self.connection.execute('COMMIT')
@@ -0,0 +1,394 @@
+import json
+import os
+from dataclasses import dataclass, field, fields
+from typing import ClassVar, List, Optional, Tuple
+
+from PIL import ImageColor
+
+
+# Text cases that can be applied to the title text or to its wrapped lines
+TEXT_CASES = (None, 'upper', 'lower', 'title')
+
+
+def _check_case(case):
+    if case not in TEXT_CASES:
+        raise ValueError(f"invalid text case {case!r}, available cases: {', '.join(map(str, TEXT_CASES))}")
+
+
+def _resolve_color(color, opacity=None):
+    # Convert a color name or hex string to an RGBA tuple once, so it is not parsed for every image
+    if color is None:
+        return None
+
+    rgba = tuple(color) if isinstance(color, (tuple, list)) else ImageColor.getrgb(color)
+    if len(rgba) == 3:
+        rgba += (255,)
+    if opacity is not None:
+        rgba = rgba[:3] + (opacity,)
+    return rgba
+
+
+@dataclass
+class BackgroundPlan:
+    color: Tuple[int, ...] = '#8194b0'
+    random_color: bool = True
+    random_colors: Tuple[Tuple[int, ...], ...] = ('#040038', '#8142f6', '#4395b1')
+    overlay: bool = False  # Draw a random image from the backgrounds folder instead of a color
+    resize: bool = False
+    analyze_luminance: bool = True  # Choose the title color by the luminance of the title region of the image
+
+    def __post_init__(self):
+        self.color = _resolve_color(self.color)
+        self.random_colors = tuple(_resolve_color(color) for color in self.random_colors)
+
+
+@dataclass
+class GradientPlan:
+    enabled: bool = False
+    direction: int = 360  # 180 - from top to bottom, 360 - from bottom to top
+
+
+@dataclass
+class FooterPlan:
+    enabled: bool = True
+    text: str = 'website.com'  # Used if the project has no footer_text.txt file
+    font: str = 'footer_font.ttf'
+    font_size: int = 40
+    height: int = 100
+    fill_color: Tuple[int, ...] = '#475b75'
+    opacity: int = 255  # Transparency value (0 - fully transparent, 255 - opaque)
+    text_color: Tuple[int, ...] = 'white'
+    text_y_offset: int = 0
+
+    def __post_init__(self):
+        self.fill_color = _resolve_color(self.fill_color, self.opacity)
+        self.text_color = _resolve_color(self.text_color)
+
+
+@dataclass
+class RectanglePlan:
+    top_padding: int = 20
+    bottom_padding: int = 20
+    horizontal_padding: int = 30
+    fill_color: Tuple[int, ...] = 'white'
+    opacity: int = 255  # Transparency value (0 - fully transparent, 255 - opaque)
+    corner_radius: int = 20
+    outline: Optional[Tuple[int, ...]] = 'grey'
+    outline_width: int = 0
+
+    # Paddings added to the text height, precomputed by the compiler
+    vertical_padding: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        self.fill_color = _resolve_color(self.fill_color, self.opacity)
+        self.outline = _resolve_color(self.outline)
+        self.vertical_padding = self.top_padding + self.bottom_padding
+
+
+@dataclass
+class CirclePlan:
+    radius: int = 40
+    x_offset: int = -55
+    y_offset: int = 0
+    fill_color: Tuple[int, ...] = '#b7abe9'
+    opacity: int = 255  # Transparency value (0 - fully transparent, 255 - opaque)
+    outline: Optional[Tuple[int, ...]] = 'grey'
+    outline_width: int = 0
+    font: Optional[str] = None  # The font of the list is used if no font is given
+    font_size: int = 40
+    text_color: Tuple[int, ...] = 'white'
+    text_x_offset: int = 0
+    text_y_offset: int = 0
+
+    def __post_init__(self):
+        self.fill_color = _resolve_color(self.fill_color, self.opacity)
+        self.outline = _resolve_color(self.outline)
+        self.text_color = _resolve_color(self.text_color)
+
+
+@dataclass
+class SecondFontPlan:
+    enabled: bool = True
+    font: str = 'title_2_font.ttf'
+    lines: int = 2  # Number of last title lines drawn with this font
+    top_padding: int = 40
+    font_size: int = 100
+    color: Tuple[int, ...] = '#876ac7'
+    line_spacing: int = 0
+
+    def __post_init__(self):
+        self.color = _resolve_color(self.color)
+
+
+@dataclass
+class TitlePlan:
+    # A title at a fixed distance from the top, centered horizontally
+    TYPE: ClassVar[str] = 'title'
+
+    column: str = 'title'  # Column of the data row with the text
+    case: Optional[str] = None  # 'upper', 'lower' or 'title', applied before wrapping
+    line_case: Optional[str] = None  # The same, applied to every wrapped line
+    font: str = 'title_font.ttf'
+    font_size: int = 75
+    max_width: int = 900
+    color: Tuple[int, ...] = 'white'
+    color_on_light: Optional[Tuple[int, ...]] = None  # Used on light backgrounds
+    line_spacing: int = 15
+    margin_from_top: int = 50
+
+    auto_fit: bool = False  # Pick the largest font size that fits the title box
+    min_font_size: int = 40
+    max_font_size: int = 100
+    max_height: int = 400
+
+    def __post_init__(self):
+        _check_case(self.case)
+        _check_case(self.line_case)
+        self.color = _resolve_color(self.color)
+        self.color_on_light = _resolve_color(self.color_on_light) or self.color
+
+    def get_font_specs(self):
+        return [(self.font, self.font_size)]
+
+
+@dataclass
+class NumberedListPlan:
+    # Numbered items in rectangles with the number in a circle, placed below the previous element
+    TYPE: ClassVar[str] = 'numbered_list'
+
+    column: str = 'tips'  # Column of the data row with the "1. Item" lines
+    font: str = 'tips_font.ttf'
+    count: int = 4  # Maximum number of items drawn
+    font_size: int = 36
+    top_margin: int = 120
+    max_text_width: int = 700
+    line_spacing: int = 10
+    margin_between_items: int = 110
+    x_offset: int = 20
+    text_color: Tuple[int, ...] = '#323232'
+    rectangle: RectanglePlan = field(default_factory=RectanglePlan)
+    circle: CirclePlan = field(default_factory=CirclePlan)
+
+    def __post_init__(self):
+        self.text_color = _resolve_color(self.text_color)
+        if self.circle.font is None:
+            self.circle.font = self.font
+
+    def get_font_specs(self):
+        return [(self.font, self.font_size), (self.circle.font, self.circle.font_size)]
+
+
+@dataclass
+class BoxedTitlePlan:
+    # A title in a rectangle centered on the canvas, the last lines can use a second font
+    TYPE: ClassVar[str] = 'boxed_title'
+
+    column: str = 'title'
+    case: Optional[str] = None
+    line_case: Optional[str] = 'title'
+    font: str = 'title_font.ttf'
+    font_size: int = 90
+    color: Tuple[int, ...] = '#323232'
+    line_spacing: int = 20
+    max_width: int = 550
+    y_offset: int = -100
+
+    auto_fit: bool = False
+    min_font_size: int = 50
+    max_font_size: int = 120
+    max_height: int = 700
+
+    second_font: SecondFontPlan = field(default_factory=SecondFontPlan)
+    rectangle: RectanglePlan = field(default_factory=RectanglePlan)
+
+    def __post_init__(self):
+        _check_case(self.case)
+        _check_case(self.line_case)
+        self.color = _resolve_color(self.color)
+
+    def get_second_font_size(self, font_size):
+        # The second font keeps its size ratio to the title font when the title size is fitted
+        if font_size == self.font_size:
+            return self.second_font.font_size
+        return max(1, round(font_size * self.second_font.font_size / self.font_size))
+
+    def get_font_specs(self):
+        return [(self.font, self.font_size), (self.second_font.font, self.second_font.font_size)]
+
+
+@dataclass
+class RenderPlan:
+    name: str
+    fonts_path: str
+    background: BackgroundPlan
+    gradient: GradientPlan
+    footer: FooterPlan
+    elements: List[object]
+
+
+# Plan class of every element type that can be used in a spec
+ELEMENT_PLANS = {plan.TYPE: plan for plan in (TitlePlan, NumberedListPlan, BoxedTitlePlan)}
+
+# Plan classes of the nested sections of the elements
+_NESTED_PLANS = {'rectangle': RectanglePlan, 'circle': CirclePlan, 'second_font': SecondFontPlan}
+
+
+def _build_plan(plan_class, data, path):
+    if not isinstance(data, dict):
+        raise ValueError(f"Invalid template spec: {path} must be an object.")
+
+    # Unknown keys are most likely typos, so they are reported instead of being ignored
+    names = {plan_field.name for plan_field in fields(plan_class) if plan_field.init}
+    unknown = set(data) - names
+    if unknown:
+        raise ValueError(f"Invalid template spec: unknown keys in {path}: {', '.join(sorted(unknown))}.")
+
+    values = dict(data)
+    for name, nested_class in _NESTED_PLANS.items():
+        if name in values and name in names:
+            values[name] = _build_plan(nested_class, values[name], f'{path}.{name}')
+
+    try:
+        return plan_class(**values)
+    except ValueError as error:
+        raise ValueError(f"Invalid template spec: {path}: {error}") from error
+
+
+def _resolve_font(fonts_path, font):
+    # Font file names are relative to the fonts folder of the template, absolute paths are kept
+    return os.path.join(fonts_path, font) if font else font
+
+
+def compile_template_spec(spec, assets_path):
+    # Turn a template spec into a render plan once, with colors resolved and paddings precomputed
+    if not isinstance(spec, dict):
+        raise ValueError("Invalid template spec: the spec must be an object.")
+
+    unknown = set(spec) - {'name', 'fonts_folder', 'background', 'gradient', 'footer', 'elements'}
+    if unknown:
+        raise ValueError(f"Invalid template spec: unknown keys: {', '.join(sorted(unknown))}.")
+
+    name = spec.get('name', 'template')
+    fonts_path = os.path.join(assets_path, spec.get('fonts_folder', name), 'fonts')
+
+    elements = []
+    for number, element in enumerate(spec.get('elements', [])):
+        element = dict(element)
+        element_type = element.pop('type', None)
+        plan_class = ELEMENT_PLANS.get(element_type)
+        if plan_class is None:
+            raise ValueError(f"Invalid template spec: unknown element type {element_type!r} in elements[{number}]. "
+                             f"Available types: {', '.join(ELEMENT_PLANS)}.")
+        elements.append(_build_plan(plan_class, element, f'elements[{number}]'))
+
+    footer = _build_plan(FooterPlan, spec.get('footer', {}), 'footer')
+    footer.font = _resolve_font(fonts_path, footer.font)
+
+    for element in elements:
+        element.font = _resolve_font(fonts_path, element.font)
+        if isinstance(element, NumberedListPlan):
+            element.circle.font = _resolve_font(fonts_path, element.circle.font)
+        if isinstance(element, BoxedTitlePlan):
+            element.second_font.font = _resolve_font(fonts_path, element.second_font.font)
+
+    return RenderPlan(name=name, fonts_path=fonts_path,
+                      background=_build_plan(BackgroundPlan, spec.get('background', {}), 'background'),
+                      gradient=_build_plan(GradientPlan, spec.get('gradient', {}), 'gradient'),
+                      footer=footer, elements=elements)
+
+
+def load_template_spec(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        if path.lower().endswith(('.yaml', '.yml')):
+            # YAML specs are optional, so PyYAML is only needed when one is used
+            try:
+                import yaml
+            except ImportError as error:
+                raise ImportError("PyYAML is required to read YAML template specs: pip install pyyaml") from error
+            return yaml.safe_load(file)
+
+        return json.load(file)
+
+
+def save_template_spec(spec, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(spec, file, indent=4)
+
+
+def _page_spec(settings):
+    # Background, gradient and footer sections shared by both settings classes
+    return {
+        'background': {'color': settings.bg_color, 'random_color': settings.random_bg_color,
+                       'random_colors': list(settings.random_colors), 'overlay': settings.overlay_bg,
+                       'resize': settings.resize_bg, 'analyze_luminance': settings.bg_luminance_analysis},
+        'gradient': {'enabled': settings.gradient, 'direction': settings.gradient_direction},
+        'footer': {'enabled': settings.footer, 'text': settings.footer_text, 'font': 'footer_font.ttf',
+                   'font_size': settings.footer_font_size, 'height': settings.footer_height,
+                   'fill_color': settings.footer_fill_color, 'opacity': settings.footer_opacity,
+                   'text_color': settings.footer_text_color, 'text_y_offset': settings.footer_text_y_offset},
+    }
+
+
+def template_1_spec(settings):
+    # Template1Settings expressed as a spec
+    return {
+        'name': 'template_1',
+        'fonts_folder': 'template_1',
+        **_page_spec(settings),
+        'elements': [
+            {'type': TitlePlan.TYPE, 'column': 'title', 'case': 'upper', 'font': 'title_font.ttf',
+             'font_size': settings.title_font_size, 'max_width': settings.title_max_width,
+             'color': settings.title_text_color_default, 'color_on_light': settings.title_text_color_dark,
+             'line_spacing': settings.title_line_spacing, 'margin_from_top': settings.title_margin_from_top,
+             'auto_fit': settings.title_auto_fit, 'min_font_size': settings.title_min_font_size,
+             'max_font_size': settings.title_max_font_size, 'max_height': settings.title_max_height},
+            {'type': NumberedListPlan.TYPE, 'column': 'tips', 'font': 'tips_font.ttf', 'count': settings.tips_count,
+             'font_size': settings.tips_font_size, 'top_margin': settings.tips_top_margin,
+             'max_text_width': settings.tips_max_text_width, 'line_spacing': settings.tips_line_spacing,
+             'margin_between_items': settings.margin_between_tips, 'x_offset': settings.tips_block_x_offset,
+             'text_color': settings.tips_text_color,
+             'rectangle': {'top_padding': settings.rectangle_top_padding,
+                           'bottom_padding': settings.rectangle_bottom_padding,
+                           'horizontal_padding': settings.rectangle_horizontal_padding,
+                           'fill_color': settings.rectangle_fill_color, 'opacity': settings.rectangle_opacity,
+                           'corner_radius': settings.rectangle_corner_radius,
+                           'outline': settings.rectangle_outline,
+                           'outline_width': settings.rectangle_outline_width},
+             'circle': {'radius': settings.circle_radius, 'x_offset': settings.circle_x_offset,
+                        'y_offset': settings.circle_y_offset, 'fill_color': settings.circle_fill_color,
+                        'opacity': settings.circle_opacity, 'outline': settings.circle_outline,
+                        'outline_width': settings.circle_outline_width, 'font': 'tips_font.ttf',
+                        'font_size': settings.tips_number_font_size, 'text_color': settings.circle_text_color,
+                        'text_x_offset': settings.circle_text_x_offset,
+                        'text_y_offset': settings.circle_text_y_offset}},
+        ],
+    }
+
+
+def template_2_spec(settings):
+    # Template2Settings expressed as a spec
+    return {
+        'name': 'template_2',
+        'fonts_folder': 'template_2',
+        **_page_spec(settings),
+        'elements': [
+            {'type': BoxedTitlePlan.TYPE, 'column': 'title', 'line_case': 'title', 'font': 'title_font.ttf',
+             'font_size': settings.title_font_size, 'color': settings.title_text_color,
+             'line_spacing': settings.title_line_spacing, 'max_width': settings.title_max_width,
+             'y_offset': settings.title_y_offset, 'auto_fit': settings.title_auto_fit,
+             'min_font_size': settings.title_min_font_size, 'max_font_size': settings.title_max_font_size,
+             'max_height': settings.title_max_height,
+             'second_font': {'enabled': settings.another_font, 'font': 'title_2_font.ttf',
+                             'lines': settings.strings_with_another_font,
+                             'top_padding': settings.another_text_top_padding,
+                             'font_size': settings.another_text_font_size, 'color': settings.another_text_color,
+                             'line_spacing': settings.another_text_line_spacing},
+             'rectangle': {'top_padding': settings.rectangle_top_padding,
+                           'bottom_padding': settings.rectangle_bottom_padding,
+                           'horizontal_padding': settings.rectangle_horizontal_padding,
+                           'fill_color': settings.rectangle_fill_color, 'opacity': settings.rectangle_opacity,
+                           'corner_radius': settings.rectangle_corner_radius,
+                           'outline': settings.rectangle_outline,
+                           'outline_width': settings.rectangle_outline_width}},
+        ],
+    }
@@ -0,0 +1,228 @@
+import math
+from weakref import WeakKeyDictionary
+
+
+class TextLayout:
+    __slots__ = ('lines', 'line_widths', 'line_boxes', 'line_spacing')
+
+    def __init__(self, lines, line_widths, line_boxes, line_spacing):
+        # Lines of text, their advance widths and their ink boxes relative to the line origin
+        self.lines = lines
+        self.line_widths = line_widths
+        self.line_boxes = line_boxes
+        # Distance between the tops of two neighbouring lines
+        self.line_spacing = line_spacing
+
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+
+    @property
+    def max_line_width(self):
+        # Width of the widest line box
+        return max((box[2] - box[0] for box in self.line_boxes), default=0)
+
+    def slice(self, start=None, stop=None):
+        # Layout of a part of the lines, the lines are not measured again
+        return TextLayout(self.lines[start:stop], self.line_widths[start:stop], self.line_boxes[start:stop],
+                          self.line_spacing)
+
+    def get_bbox(self, xy=(0, 0), align='left'):
+        # Bounding box of the whole text, computed the same way as ImageDraw.multiline_textbbox
+        x, y = xy
+        max_width = max(self.line_widths, default=0)
+
+        bbox = None
+        top = y
+        for line_width, line_box in zip(self.line_widths, self.line_boxes):
+            left = x
+            if align == 'center':
+                left += (max_width - line_width) / 2.0
+            elif align == 'right':
+                left += max_width - line_width
+
+            line_bbox = (line_box[0] + left, line_box[1] + top, line_box[2] + left, line_box[3] + top)
+            if bbox is None:
+                bbox = line_bbox
+            else:
+                bbox = (min(bbox[0], line_bbox[0]), min(bbox[1], line_bbox[1]),
+                        max(bbox[2], line_bbox[2]), max(bbox[3], line_bbox[3]))
+
+            top += self.line_spacing
+
+        if bbox is None:
+            return x, y, x, y
+        return bbox
+
+    def get_size(self, align='left'):
+        bbox = self.get_bbox(align=align)
+        return bbox[2] - bbox[0], bbox[3] - bbox[1]
+
+
+class TextLayoutEngine:
+    # Maximum number of words kept in the width cache of a font
+    MAX_WORDS = 100_000
+
+    def __init__(self, font):
+        self.font = font
+        self.space_width = font.getlength(' ')
+        self.empty_box = font.getbbox('')
+        # Height of a line without spacing, as used by ImageDraw for multiline text
+        self.line_height = font.getbbox('A')[3]
+
+        self._words = {}
+
+    def measure_word(self, word):
+        metrics = self._words.get(word)
+        if metrics is None:
+            if len(self._words) >= self.MAX_WORDS:
+                self._words.clear()
+
+            # Advance width and ink box of the word, measured once per font
+            metrics = (self.font.getlength(word), self.font.getbbox(word))
+            self._words[word] = metrics
+
+        return metrics
+
+    @staticmethod
+    def _get_right_bounds(start, word_right):
+        # FreeType places every glyph on a whole pixel, so a word that starts at a fractional pen position
+        # can end one pixel left or right of its box measured at zero. On a whole pixel the box is exact.
+        right = start + word_right
+        if start % 1 == 0:
+            return right, right
+        return math.ceil(right) - 1, math.floor(right) + 1
+
+    def measure_line(self, words):
+        # Add up the cached widths of the words and the spaces between them
+        pen = 0
+        box = None
+        right_high = None
+        exact = True
+        for word in words:
+            advance, word_box = self.measure_word(word)
+
+            # Empty words come from repeated spaces and have no ink
+            if word:
+                low, high = self._get_right_bounds(pen, word_box[2])
+
+                if box is None:
+                    box = (pen + word_box[0], word_box[1], low, word_box[3])
+                    right_high = high
+                    # The box of a line that starts with spaces reaches back to the origin
+                    exact = pen == 0
+                else:
+                    box = (box[0], min(box[1], word_box[1]), max(box[2], low), max(box[3], word_box[3]))
+                    right_high = max(right_high, high)
+
+            pen += advance + self.space_width
+
+        if box is None:
+            return max(0, pen - self.space_width), self.font.getbbox(' '.join(words)) if words else self.empty_box
+
+        # The box of a line that ends with spaces reaches to its advance width
+        if not words[-1]:
+            exact = False
+
+        if not exact or box[2] != right_high:
+            # The edges depend on the pixel positions of the glyphs or the spaces, measure the whole line
+            box = self.font.getbbox(' '.join(words))
+
+        return pen - self.space_width, box
+
+    def _wrap_lines(self, text, max_width):
+        # Greedily fill the lines with words while the ink width stays within max_width,
+        # the line metrics are collected on the way so the lines do not have to be measured again.
+        # The right edge of a line is known between right_low and right_high, the line is measured
+        # as a whole only when the word might fit and the bounds do not tell.
+        lines = []
+        line_widths = []
+        line_boxes = []
+        line = []
+        left = top = right_low = right_high = bottom = pen = 0
+
+        words = self._words
+        space_width = self.space_width
+        get_right_bounds = self._get_right_bounds
+
+        for word in text.split():
+            metrics = words.get(word) or self.measure_word(word)
+            advance, box = metrics
+
+            if line:
+                start = pen + space_width
+                word_low, word_high = get_right_bounds(start, box[2])
+                line_low = max(right_low, word_low)
+                line_high = max(right_high, word_high)
+
+                if line_high - left > max_width >= line_low - left:
+                    line_low = line_high = self.font.getbbox(' '.join(line) + ' ' + word)[2]
+
+                if line_high - left <= max_width:
+                    line.append(word)
+                    if box[1] < top:
+                        top = box[1]
+                    right_low, right_high = line_low, line_high
+                    if box[3] > bottom:
+                        bottom = box[3]
+                    pen = start + advance
+                    continue
+
+                self._add_line(lines, line_widths, line_boxes, line, pen, (left, top, right_low, bottom), right_high)
+
+            line = [word]
+            left, top, right_low, bottom = box
+            right_high = right_low
+            pen = advance
+
+        if line:
+            self._add_line(lines, line_widths, line_boxes, line, pen, (left, top, right_low, bottom), right_high)
+
+        return lines, line_widths, line_boxes
+
+    def _add_line(self, lines, line_widths, line_boxes, line, pen, box, right_high):
+        text = ' '.join(line)
+        if box[2] != right_high:
+            # The right edge depends on the pixel positions of the glyphs, measure the whole line
+            box = (box[0], box[1], self.font.getbbox(text)[2], box[3])
+
+        lines.append(text)
+        line_widths.append(pen)
+        line_boxes.append(box)
+
+    def wrap(self, text, max_width):
+        return self._wrap_lines(text, max_width)[0]
+
+    def layout_lines(self, lines, spacing=4):
+        line_widths = []
+        line_boxes = []
+        for line in lines:
+            line_width, line_box = self.measure_line(line.split(' ') if line else [])
+            line_widths.append(line_width)
+            line_boxes.append(line_box)
+
+        return TextLayout(list(lines), line_widths, line_boxes, self.line_height + spacing)
+
+    def layout(self, text, max_width=None, spacing=4):
+        # Wrap the text if a maximum width is given, otherwise keep its own line breaks
+        if max_width is None:
+            return self.layout_lines(text.split('\n'), spacing)
+
+        lines, line_widths, line_boxes = self._wrap_lines(text, max_width)
+        return TextLayout(lines, line_widths, line_boxes, self.line_height + spacing)
+
+
+# Layout engines of the fonts used in this process
+_ENGINES = WeakKeyDictionary()
+
+
+def get_layout_engine(font):
+    engine = _ENGINES.get(font)
+    if engine is None:
+        engine = TextLayoutEngine(font)
+        _ENGINES[font] = engine
+    return engine
+
+
+def layout_text(text, font, max_width=None, spacing=4):
+    return get_layout_engine(font).layout(text, max_width, spacing)
@@ -1,17 +1,49 @@
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from threading import Lock
 
-import g4f
-import gspread
-from google.oauth2.service_account import Credentials
-from modules.base import Pinterest
+from modules.base import CsvAppender, Pinterest
+from modules.hedging import HedgedCaller
+from modules.llm_backends import BackendError, create_backend
+from modules.prompt_cache import PromptCache
+from modules.rate_limiter import RateLimiter
 
 
 class Writer(Pinterest):
-    def __init__(self, project_folder):
+    def __init__(self, project_folder, backend='g4f', cache=True, cache_ttl=30 * 24 * 3600,
+                 cache_max_bytes=64 * 1024 * 1024, cache_bypass=False, rate_limit=None, hedge=None):
         super().__init__(project_folder)
 
+        # Backend that answers the prompts, a backend name, a config dictionary or a backend instance
+        self.backend = create_backend(backend)
+
+        # Second copies of the calls that are slower than usual for the backend. hedge is a dictionary
+        # with the parameters of the HedgedCaller, None sends every prompt once.
+        self.hedger = HedgedCaller(**hedge) if hedge else None
+
+        # Request rate, concurrent calls and retries of the backend calls, shared by all writer threads.
+        # rate_limit is a dictionary with the parameters of the RateLimiter, None calls the backend directly.
+        # The hedged copies of a call get their own request token and slot.
+        self.rate_limiter = RateLimiter(**rate_limit, hedger=self.hedger) if rate_limit else None
+
+        self.rows_queued = 0
+
+        # Number of rows in the retry queue when the rows of a mode were taken from it, by mode
+        self._retry_rows_taken = {}
+
+        # Answers of the model by model and prompt, shared by all projects. With cache_bypass the prompts
+        # are sent to the model again and the new answers replace the stored ones.
+        self.prompt_cache = None
+        if cache:
+            self.prompt_cache = PromptCache(os.path.join(self.data_path, self.PROMPT_CACHE_FILE), ttl=cache_ttl,
+                                            max_bytes=cache_max_bytes, bypass=cache_bypass)
+
     def open_data(self, mode, google_sheet=True, table_id=None):
         if google_sheet:
+            # The Google Sheets client is needed only for this source
+            import gspread
+
             # Obtain Google Sheets credentials
             creds = self._get_google_creds()
 
@@ -69,6 +101,8 @@ class Writer(Pinterest):
         return data
 
     def _get_google_creds(self):
+        from google.oauth2.service_account import Credentials
+
         # Specify the path to the JSON key file
         json_key_path = os.path.join(self.data_path, 'keyfile.json')
 
@@ -81,61 +115,247 @@ class Writer(Pinterest):
         return credentials
 
     def write_single_prompt(self, prompt):
-        # Create a ChatCompletion instance from g4f module using the OpenAI GPT model (gpt_3.5_turbo)
-        # to generate content based on the provided prompt.
-        # The prompt is set as a user message in the 'messages' parameter.
-        response = g4f.ChatCompletion.create(
-            model=g4f.models.gpt_35_turbo,
-            messages=[{'role': 'user', 'content': prompt}]
-        )
+        # Reuse the answer to the same prompt from an earlier run
+        if self.prompt_cache is not None:
+            response = self.prompt_cache.get(self.backend.name, prompt)
+            if response is not None:
+                return response
+
+        # Generate content based on the provided prompt with the configured backend
+        response = self._complete(prompt)
+
+        if self.prompt_cache is not None:
+            self.prompt_cache.put(self.backend.name, prompt, response)
 
         # Return the generated response
         return response
 
-    def write(self, row, mode):
+    def _complete(self, prompt):
+        if self.rate_limiter is not None:
+            return self.rate_limiter.call(self._complete_once, prompt, name=self.backend.name)
+        if self.hedger is not None:
+            return self.hedger.call(self.backend.name, self._complete_copy, prompt)
+        return self._complete_once(prompt)
+
+    def _complete_copy(self, copy, prompt):
+        # One copy of a hedged call without the rate limiter
+        return copy.run(self._complete_once, prompt)
+
+    def _complete_once(self, prompt):
+        response = self.backend.complete(prompt)
+
+        # An empty answer is a failed call, it is retried and the row is queued if the answer stays empty
+        if not response:
+            raise BackendError(f'Empty answer from {self.backend.name}')
+
+        return response
+
+    def close(self):
+        # Flush the buffered rows to the CSV files and report the use of the prompt cache, rate limiter and hedging
+        self.close_appenders()
+
+        if self.rows_queued:
+            self._log_message(f'{self.rows_queued} rows failed and have been added to {self.WRITER_RETRY_FILE}.')
+            self.rows_queued = 0
+
+        if self.rate_limiter is not None:
+            limiter_stats = self.rate_limiter.stats()
+            self._log_message(f"Rate limiter: {limiter_stats['calls']} calls, {limiter_stats['retries']} retries, "
+                              f"{limiter_stats['failures']} failures, throttled for "
+                              f"{limiter_stats['throttled_seconds']:.1f} s, concurrency limit "
+                              f"{limiter_stats['concurrency_limit']} after "
+                              f"{limiter_stats['concurrency_decreases']} decreases.")
+
+        if self.hedger is not None:
+            hedge_stats = self.hedger.stats()
+            delays = ', '.join(f'{name} {delay * 1000:.0f} ms'
+                               for name, delay in hedge_stats['delays'].items() if delay)
+            self._log_message(f"Hedging: {hedge_stats['hedges']} of {hedge_stats['calls']} calls hedged, "
+                              f"{hedge_stats['hedges_won']} hedges won, {hedge_stats['saved_seconds']:.1f} s saved"
+                              f"{f', hedge delay {delays}' if delays else ''}.")
+            self.hedger.close()
+            self.hedger = None
+
+        if self.prompt_cache is not None:
+            cache_stats = self.prompt_cache.stats()
+            self._log_message(f"Prompt cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                              f"hit rate {cache_stats['hit_rate']:.1%}, {cache_stats['expired']} expired, "
+                              f"{cache_stats['evicted']} evicted, {cache_stats['entries']} answers, "
+                              f"{cache_stats['bytes'] / 1024 / 1024:.1f} MB.")
+            self.prompt_cache.close()
+            self.prompt_cache = None
+
+    def _check_mode(self, mode):
         # Check if the mode is valid
         if mode not in [self.WRITER_MODE_1, self.WRITER_MODE_2, self.WRITER_MODE_3]:
             raise ValueError(f"Invalid mode: {mode}. Check the available modes in the base class.")
 
+    def _init_results(self, row, mode):
         # Initialize results dictionary with default values
-        results = {
+        return {
             'mode': mode,
+            'keyword': row.get('keyword', ''),
             'file_path': '',
             'board_name': '',
             'pin_link': ''
         }
 
-        try:
-            # Extract keyword from the row or set it to an empty string if not present
-            results['keyword'] = row.get('keyword', '')
+    @staticmethod
+    def _clean_response(response):
+        return response.strip('"') if response else ''
+
+    def _get_title_prompts(self, row, mode, title):
+        # Prompts that need the generated title, they do not depend on each other.
+        # 'SELECTED TITLE' in the prompts is replaced with the title, or the keyword if there is no title.
+        selected_title = title if title else row.get('keyword', '')
+
+        prompts = {'description': row.get('description_prompt', '').replace('SELECTED TITLE', selected_title)}
+        if mode == self.WRITER_MODE_2:
+            # Tips are written only in image mode
+            prompts['tips'] = row.get('tips_prompt', '').replace('SELECTED TITLE', selected_title)
+
+        return prompts
+
+    def _get_output_filename(self, mode):
+        # Determine the filename based on the mode
+        return self.GENERATOR_DATA_FILE if mode == self.WRITER_MODE_2 else self.UPLOADING_DATA_FILE
+
+    def _finish_row(self, row, mode, results, error):
+        if error is None:
+            # Append the results to the corresponding CSV file
+            self._get_appender(self._get_output_filename(mode)).write(results)
+            return True
 
+        # A row with a failed prompt is not written with empty fields, it is queued to be written again
+        retry_data = {
+            'mode': mode,
+            'keyword': row.get('keyword', ''),
+            'title_prompt': row.get('title_prompt', ''),
+            'description_prompt': row.get('description_prompt', ''),
+            'tips_prompt': row.get('tips_prompt', ''),
+            'error': str(error),
+        }
+        self._get_appender(self.WRITER_RETRY_FILE).write(retry_data)
+        self.rows_queued += 1
+        return False
+
+    def take_retry_queue(self, mode):
+        # Queued rows of the mode. They stay in the queue until release_retry_queue is called after they have been
+        # written or queued again, so the rows are not lost if the run stops before.
+        if not os.path.exists(self._get_data_file_path(self.WRITER_RETRY_FILE)):
+            return []
+
+        rows = self.open_csv(self.WRITER_RETRY_FILE)
+        self._retry_rows_taken[mode] = len(rows)
+
+        return [row for row in rows if row.get('mode') == mode]
+
+    def release_retry_queue(self, mode):
+        # Remove the rows taken by take_retry_queue from the queue, the rows that failed again were added after them
+        taken = self._retry_rows_taken.pop(mode, 0)
+        if not taken:
+            return
+
+        # Write the rows queued again before the file is replaced
+        appender = self._appenders.pop(self.WRITER_RETRY_FILE, None)
+        if appender is not None:
+            appender.close()
+
+        data_file_path = self._get_data_file_path(self.WRITER_RETRY_FILE)
+        rows = self.open_csv(self.WRITER_RETRY_FILE)
+
+        # Write the remaining rows to a temporary file and replace the queue with it
+        temp_path = f'{data_file_path}.tmp'
+        with CsvAppender(temp_path, self.CSV_HEADERS[self.WRITER_RETRY_FILE], fsync=True) as temp_appender:
+            temp_appender.writerows(row for number, row in enumerate(rows)
+                                    if number >= taken or row.get('mode') != mode)
+        os.replace(temp_path, data_file_path)
+
+    def write(self, row, mode):
+        self._check_mode(mode)
+        results = self._init_results(row, mode)
+        error = None
+
+        try:
             # Write title and log the process
             self._log_message('Writing title...')
-            # Extract title prompt
-            title_prompt = row.get('title_prompt', '')
-            title = self.write_single_prompt(title_prompt)
-            results['title'] = title.strip('"') if title else ''
-
-            # Write description and log the process
-            self._log_message('Writing description...')
-            # Replace 'SELECTED TITLE' in the description prompt with the generated title
-            description_prompt = row.get('description_prompt', '') \
-                .replace('SELECTED TITLE', title if title else row.get('keyword', ''))
-            description = self.write_single_prompt(description_prompt)
-            results['description'] = description.strip('"') if description else ''
+            title = self.write_single_prompt(row.get('title_prompt', ''))
+            results['title'] = self._clean_response(title)
 
-            if mode == self.WRITER_MODE_2:
-                # Write tips for image mode and log the process
-                self._log_message('Writing tips...')
-                # Replace 'SELECTED TITLE' in the tips prompt with the generated title
-                tips_prompt = row.get('tips_prompt', '') \
-                    .replace('SELECTED TITLE', title if title else row.get('keyword', ''))
-                tips = self.write_single_prompt(tips_prompt)
-                results['tips'] = tips.strip('"') if tips else ''
+            for name, prompt in self._get_title_prompts(row, mode, title).items():
+                # Write description and tips and log the process
+                self._log_message(f'Writing {name}...')
+                results[name] = self._clean_response(self.write_single_prompt(prompt))
         except Exception as e:
             # Log an error if an exception occurs during writing
             self._log_error(f"Error while writing: ", e)
+            error = e
+
+        return self._finish_row(row, mode, results, error)
+
+    def _submit_row(self, executor, row, mode):
+        # Start the prompts of a row: the title first, then the prompts that need it in parallel.
+        # The returned future is done when all prompts of the row have finished, with the results and first error.
+        row_future = Future()
+        results = self._init_results(row, mode)
+        errors = []
+
+        def on_prompt_done(name, remaining, lock, future):
+            try:
+                results[name] = self._clean_response(future.result())
+            except Exception as e:
+                self._log_error(f"Error while writing {name}: ", e)
+                errors.append(e)
+
+            with lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done:
+                row_future.set_result((results, errors[0] if errors else None))
+
+        def on_title_done(future):
+            try:
+                title = future.result()
+            except Exception as e:
+                # Without a title the other prompts are not written, like in the sequential mode
+                self._log_error(f"Error while writing title: ", e)
+                row_future.set_result((results, e))
+                return
+
+            results['title'] = self._clean_response(title)
+
+            prompts = self._get_title_prompts(row, mode, title)
+            remaining, lock = [len(prompts)], Lock()
+            for name, prompt in prompts.items():
+                prompt_future = executor.submit(self.write_single_prompt, prompt)
+                prompt_future.add_done_callback(partial(on_prompt_done, name, remaining, lock))
+
+        executor.submit(self.write_single_prompt, row.get('title_prompt', '')).add_done_callback(on_title_done)
+        return row_future
+
+    def write_many(self, rows, mode, max_workers=8, max_rows_in_flight=None):
+        # Write the rows with up to max_workers prompts running at the same time.
+        # The results are appended in the order of the rows, whatever order the prompts finish in.
+        self._check_mode(mode)
+
+        if max_rows_in_flight is None:
+            max_rows_in_flight = max_workers * 2
+
+        pending = []
+        rows_written = 0
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='Writer') as executor:
+            for row in rows:
+                pending.append((row, self._submit_row(executor, row, mode)))
+
+                # Wait for the oldest row when enough rows are in flight, so the input is read as it is needed
+                while len(pending) >= max_rows_in_flight:
+                    row_done, row_future = pending.pop(0)
+                    rows_written += self._finish_row(row_done, mode, *row_future.result())
+
+            # Write the remaining rows in order
+            for row_done, row_future in pending:
+                rows_written += self._finish_row(row_done, mode, *row_future.result())
 
-        # Determine the filename based on the mode and write the results to the corresponding CSV file
-        filename = self.GENERATOR_DATA_FILE if mode == self.WRITER_MODE_2 else self.UPLOADING_DATA_FILE
-        self.write_csv(results, filename)
\ No newline at end of file
+        self._log_message(f'{rows_written} rows have been written.')
+        return rows_written
@@ -0,0 +1,97 @@
+import dataclasses
+import hashlib
+import json
+import os
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont, features
+
+import modules.image_generator as image_generator
+
+# Hashes of the renders of the generators before the layers were drawn region-sized, so every
+# optimization of the renderer has to keep its output identical
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baselines', 'render_hashes.json')
+
+FONT_FILES = ('title_font.ttf', 'title_2_font.ttf', 'tips_font.ttf', 'footer_font.ttf')
+
+ROWS = [
+    {'title': 'How to lose weight fast on keto diet in two weeks',
+     'tips': '1. Eat more healthy fats every day.\n2. Drink a lot of water;\n'
+             '3. Avoid sugar and all the hidden carbs in sauces and dressings.\n4. Sleep well.\n5. Extra tip'},
+    {'title': 'Short', 'tips': '1. One.\n2. Two'},
+    {'title': 'A very very long title that will wrap over several lines because it keeps going and going forever',
+     'tips': 'garbage\n1. Only valid line here with quite a few words to wrap around the rectangle width limit'},
+]
+
+# Settings of every case, the random choices are disabled so the renders do not depend on the random generator
+CASES = {
+    'template_1': (image_generator.Template1ImageGenerator, 'Template1Settings', 'bg_light.png',
+                   {'random_bg_color': False, 'overlay_bg': True, 'gradient': True}),
+    'template_1_plain': (image_generator.Template1ImageGenerator, 'Template1Settings', 'bg_light.png',
+                         {'random_bg_color': False, 'overlay_bg': False, 'footer_opacity': 128}),
+    'template_2': (image_generator.Template2ImageGenerator, 'Template2Settings', 'bg.png',
+                   {'random_bg_color': False, 'overlay_bg': True, 'gradient': True, 'gradient_direction': 180}),
+    'template_2_plain': (image_generator.Template2ImageGenerator, 'Template2Settings', 'bg.png',
+                         {'random_bg_color': False, 'overlay_bg': False, 'footer': False}),
+}
+
+
+def make_project(folder, background_name):
+    # The font bundled with Pillow is used for every font of the templates
+    font_data = ImageFont.load_default(size=20).path.getvalue()
+    for template in ('template_1', 'template_2'):
+        fonts_path = os.path.join(folder, 'data', 'image_assets', template, 'fonts')
+        os.makedirs(fonts_path, exist_ok=True)
+        for font_file in FONT_FILES:
+            with open(os.path.join(fonts_path, font_file), 'wb') as f:
+                f.write(font_data)
+
+    # A background with a few shapes, light or dark as its name says
+    backgrounds_path = os.path.join(folder, 'projects', 'regression', 'assets', 'backgrounds')
+    os.makedirs(backgrounds_path, exist_ok=True)
+    light = 'light' in background_name
+    image = Image.new('RGB', (1000, 1500), (235, 230, 220) if light else (30, 35, 50))
+    draw = ImageDraw.Draw(image)
+    for number in range(6):
+        shade = (200 - number * 10) if light else (40 + number * 10)
+        draw.rectangle((number * 60, number * 100, 1000 - number * 40, 1500 - number * 80), fill=(shade,) * 3)
+    image.save(os.path.join(backgrounds_path, background_name))
+
+
+def render(case):
+    generator_class, settings_name, _, overrides = CASES[case]
+
+    # The settings are replaced in the module, so the renderers without specs use them as well
+    settings_class = getattr(image_generator, settings_name)
+    setattr(image_generator, settings_name,
+            lambda: dataclasses.replace(settings_class(), **overrides))
+    try:
+        generator = generator_class('regression', save=False, show=False)
+    finally:
+        setattr(image_generator, settings_name, settings_class)
+
+    hashes = []
+    for image_number, row in enumerate(ROWS, 1):
+        generator.generate_image(dict(row), image_number)
+        canvas = generator.canvas
+        hashes.append(hashlib.md5(f'{canvas.mode}{canvas.size}'.encode() + canvas.tobytes()).hexdigest())
+    return hashes
+
+
+def load_baseline():
+    with open(BASELINE_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_render_matches_baseline(case, tmp_path, monkeypatch):
+    baseline = load_baseline()
+
+    # The text of the renders depends on the FreeType version, the hashes were recorded with one of them
+    if features.version('freetype2') != baseline['freetype2']:
+        pytest.skip(f"Baseline renders were recorded with FreeType {baseline['freetype2']}")
+
+    monkeypatch.chdir(tmp_path)
+    make_project(str(tmp_path), CASES[case][2])
+
+    assert render(case) == baseline['renders'][case]
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+from PIL import ImageFont
+
+from modules.text_layout import TextLayoutEngine
+
+CHARACTERS = 'AVTWYfjrL.,;:!?"\'()-/abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+def random_words(rng, count):
+    return [''.join(rng.choice(CHARACTERS) for _ in range(rng.randint(1, 9))) for _ in range(count)]
+
+
+def pillow_wrap(font, text, max_width):
+    # The word wrapping as the templates did it with Pillow, measuring the whole line for every word
+    lines = []
+    line = []
+    for word in text.split():
+        if line:
+            box = font.getbbox(' '.join(line + [word]))
+            if box[2] - box[0] <= max_width:
+                line.append(word)
+                continue
+            lines.append(' '.join(line))
+        line = [word]
+    if line:
+        lines.append(' '.join(line))
+    return lines
+
+
+@pytest.fixture(params=[17, 36, 75, 100])
+def font(request):
+    # The font bundled with Pillow, its advance widths are fractional at these sizes
+    return ImageFont.load_default(size=request.param)
+
+
+def test_measure_line_matches_pillow(font):
+    engine = TextLayoutEngine(font)
+    rng = random.Random(font.size)
+
+    lines = ['AVATAR V,', ' leading space', 'trailing space ', 'double  space']
+    lines += [' '.join(random_words(rng, rng.randint(1, 6))) for _ in range(300)]
+    for line in lines:
+        width, box = engine.measure_line(line.split(' '))
+        assert tuple(box) == font.getbbox(line), line
+        assert width == font.getlength(line), line
+
+
+def test_wrap_matches_pillow(font):
+    engine = TextLayoutEngine(font)
+    rng = random.Random(font.size)
+
+    for _ in range(100):
+        text = ' '.join(random_words(rng, rng.randint(1, 30)))
+        max_width = rng.randint(100, 900)
+
+        layout = engine.layout(text, max_width)
+        assert layout.lines == pillow_wrap(font, text, max_width), text
+        assert [tuple(box) for box in layout.line_boxes] == [font.getbbox(line) for line in layout.lines], text